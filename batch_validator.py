@@ -0,0 +1,115 @@
+# Batch Validator - checks many levels at once with NumPy
+
+import numpy as np
+
+from level import Level
+
+
+def stack_levels(levels):
+    """Stack same-sized levels into an (N, H, W) uint8 array of tile codes."""
+    grids = []
+    for level in levels:
+        if isinstance(level, Level):
+            flat = np.frombuffer(level.tiles, dtype=np.uint8)
+            grids.append(flat.reshape(level.height, level.width))
+        else:
+            flat = np.frombuffer(''.join(level).encode('ascii'), dtype=np.uint8)
+            grids.append(flat.reshape(len(level), len(level[0])))
+    return np.stack(grids)
+
+
+class BatchValidator:
+    """
+    Validates a whole stack of levels at once.
+    
+    Instead of one BFS per level, the reachable area of every level is
+    grown together one step per iteration (a flood fill on boolean
+    masks), so the work is a few array operations over all N levels.
+    Results match LevelValidator.is_playable() and get_connectivity().
+    """
+    
+    def __init__(self, levels):
+        # Accept an (N, H, W) array of tile codes or a list of levels
+        if isinstance(levels, np.ndarray):
+            self.tiles = levels.astype(np.uint8, copy=False)
+        else:
+            self.tiles = stack_levels(levels)
+        self.count, self.height, self.width = self.tiles.shape
+        self.walkable = self.tiles != ord('#')
+        
+        self.player, self.has_player = self._find(ord('P'))
+        self.exit, self.has_exit = self._find(ord('E'))
+        self._reachable = None
+    
+    def _find(self, code):
+        """First (row-major) flat index of a tile in each level, and whether it exists."""
+        matches = (self.tiles == code).reshape(self.count, -1)
+        return matches.argmax(axis=1), matches.any(axis=1)
+    
+    def reachable(self):
+        """
+        Boolean (N, H, W) masks of the tiles reachable from each player.
+        
+        Every iteration adds the walkable neighbours of the current
+        frontier; levels whose area stopped growing drop out of the
+        working set.
+        """
+        if self._reachable is not None:
+            return self._reachable
+        
+        reach = np.zeros((self.count, self.height * self.width), dtype=bool)
+        players = np.nonzero(self.has_player)[0]
+        reach[players, self.player[players]] = True
+        reach = reach.reshape(self.count, self.height, self.width)
+        
+        active = players
+        while active.size:
+            current = reach[active]
+            grown = current.copy()
+            grown[:, 1:, :] |= current[:, :-1, :]
+            grown[:, :-1, :] |= current[:, 1:, :]
+            grown[:, :, 1:] |= current[:, :, :-1]
+            grown[:, :, :-1] |= current[:, :, 1:]
+            grown &= self.walkable[active]
+            grown |= current
+            
+            changed = (grown != current).reshape(active.size, -1).any(axis=1)
+            reach[active] = grown
+            active = active[changed]
+        
+        self._reachable = reach
+        return reach
+    
+    def reachable_counts(self):
+        """Number of reachable tiles per level (0 if there is no player)."""
+        return self.reachable().reshape(self.count, -1).sum(axis=1)
+    
+    def is_playable(self):
+        """Check every level. Returns a list of (playable, message) like LevelValidator."""
+        reach = self.reachable().reshape(self.count, -1)
+        exit_reached = reach[np.arange(self.count), self.exit]
+        
+        results = []
+        for n in range(self.count):
+            if not self.has_player[n]:
+                results.append((False, "No player start"))
+            elif not self.has_exit[n]:
+                results.append((False, "No exit"))
+            elif exit_reached[n]:
+                results.append((True, "Playable"))
+            else:
+                results.append((False, "Exit not reachable"))
+        return results
+    
+    def get_connectivity(self):
+        """Fraction of walkable tiles reachable from the player, per level."""
+        reached = self.reachable_counts()
+        walkable = self.walkable.reshape(self.count, -1).sum(axis=1)
+        
+        connectivity = []
+        for n in range(self.count):
+            if not self.has_player[n] or walkable[n] == 0:
+                connectivity.append(0.0)
+            else:
+                connectivity.append(int(reached[n]) / int(walkable[n]))
+        return connectivity
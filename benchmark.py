@@ -0,0 +1,295 @@
+# Benchmark - times the generation pipeline, with a stub or the real model
+
+import argparse
+import json
+import random
+import time
+
+from level_generator import LevelGenerator
+from validator import LevelValidator
+from evaluator import LevelEvaluator
+from engine_base import Engine
+from config import ENGINE_BACKEND
+
+DIFFICULTIES = ["easy", "medium", "hard"]
+DEFAULT_SIZES = "20x12,40x24,80x48"
+
+# Pipeline stages timed per level, in order
+STAGES = ["_parse", "_connect_all_floors", "_fix_level", "_fix_entity_counts", "LevelValidator", "evaluate_batch"]
+
+# Kinds of broken output the stub produces, like the ones TinyLlama writes
+MALFORMED = ["chatter", "truncated", "ragged", "extra_entities", "no_entities", "junk", "prose"]
+
+
+class StubEngine(Engine):
+    """
+    Deterministic stand-in for LLMEngine.
+    
+    Replays canned outputs in order if any are given, otherwise writes
+    synthetic levels: random rooms joined by corridors, with a share of
+    them broken the way real model output is (chatter around the grid,
+    missing or ragged rows, stray characters, extra players). The same
+    seed always gives the same outputs.
+    """
+    
+    def __init__(self, width, height, seed=0, malformed_rate=0.3, outputs=None):
+        self.width = width
+        self.height = height
+        self.malformed_rate = malformed_rate
+        self.outputs = outputs
+        self.rng = random.Random(seed)
+        self.calls = 0
+    
+    def generate_batch(self, prompts, n_per_prompt=1, seed=None):
+        """Return n_per_prompt outputs for each prompt, like LLMEngine."""
+        if seed is not None:
+            self.rng.seed(seed)
+        result = []
+        for _ in prompts:
+            result.append([self._next() for _ in range(n_per_prompt)])
+        return result
+    
+    def _next(self):
+        """Next canned output, or a new synthetic one."""
+        self.calls += 1
+        if self.outputs:
+            return self.outputs[(self.calls - 1) % len(self.outputs)]
+        rows = self._grid()
+        if self.rng.random() < self.malformed_rate:
+            return self._break(rows, self.rng.choice(MALFORMED))
+        return '\n'.join(rows)
+    
+    def _grid(self):
+        """A walled grid with a few rooms, corridors between them and entities."""
+        rng = self.rng
+        w, h = self.width, self.height
+        grid = [['#'] * w for _ in range(h)]
+        
+        centers = []
+        for _ in range(max(2, w * h // 80)):
+            rh, rw = rng.randint(2, max(2, h // 3)), rng.randint(3, max(3, w // 4))
+            top, left = rng.randint(1, max(1, h - rh - 1)), rng.randint(1, max(1, w - rw - 1))
+            for i in range(top, min(h - 1, top + rh)):
+                for j in range(left, min(w - 1, left + rw)):
+                    grid[i][j] = '.'
+            centers.append((min(h - 2, top + rh // 2), min(w - 2, left + rw // 2)))
+        
+        # Join most rooms; leaving some out gives the repair stages work
+        for (i1, j1), (i2, j2) in zip(centers, centers[1:]):
+            if rng.random() < 0.3:
+                continue
+            for j in range(min(j1, j2), max(j1, j2) + 1):
+                grid[i1][j] = '.'
+            for i in range(min(i1, i2), max(i1, i2) + 1):
+                grid[i][j2] = '.'
+        
+        floors = [(i, j) for i in range(h) for j in range(w) if grid[i][j] == '.']
+        rng.shuffle(floors)
+        for char, count in (('P', 1), ('E', 1), ('T', rng.randint(0, 6)), ('M', rng.randint(0, 8))):
+            for _ in range(count):
+                if floors:
+                    i, j = floors.pop()
+                    grid[i][j] = char
+        return [''.join(row) for row in grid]
+    
+    def _break(self, rows, kind):
+        """Damage a grid in one of the MALFORMED ways."""
+        rng = self.rng
+        if kind == "chatter":
+            return "Sure! Here is your level:\n\n" + '\n'.join(rows) + "\n\nThe player starts at P."
+        if kind == "truncated":
+            return '\n'.join(rows[:rng.randint(1, len(rows) - 1)])
+        if kind == "ragged":
+            return '\n'.join(row[:rng.randint(1, len(row))] + '.' * rng.randint(0, 3) for row in rows)
+        if kind == "extra_entities":
+            rows = [row.replace('.', rng.choice('PE'), 1) if rng.random() < 0.3 else row for row in rows]
+            return '\n'.join(rows)
+        if kind == "no_entities":
+            return '\n'.join(row.translate(str.maketrans('PETM', '....')) for row in rows)
+        if kind == "junk":
+            return '\n'.join(''.join(c if rng.random() > 0.1 else rng.choice('x|=- ') for c in row) for row in rows)
+        return "I'm sorry, I can only describe the level: a dungeon with a few rooms and monsters."
+
+
+def percentiles(samples):
+    """Summary of timing samples in seconds: percentiles in microseconds and throughput."""
+    ordered = sorted(samples)
+    
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+    
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'p50_us': round(pick(0.50), 1),
+        'p90_us': round(pick(0.90), 1),
+        'p99_us': round(pick(0.99), 1),
+        'max_us': round(ordered[-1] * 1e6, 1),
+        'per_sec': round(len(ordered) / total, 1) if total > 0 else None,
+    }
+
+
+def timed(func, *args):
+    """Call func and return (result, seconds)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_pipeline(width, height, levels=200, seed=0, malformed_rate=0.3, batch_size=32):
+    """
+    Time each repair/validation stage on stub outputs of one grid size.
+    
+    _connect_all_floors is timed on its own copy of the parsed level, so
+    its number is not mixed into _fix_level (which calls it).
+    evaluate_batch is timed per batch and reported per level.
+    """
+    random.seed(seed)
+    engine = StubEngine(width, height, seed, malformed_rate)
+    generator = LevelGenerator(engine, width, height)
+    evaluator = LevelEvaluator()
+    settings, num_treasures, num_monsters = generator._get_settings("medium")
+    
+    samples = {stage: [] for stage in STAGES}
+    finished = []
+    playable = 0
+    for raw in (engine.generate("") for _ in range(levels)):
+        level, seconds = timed(generator._parse, raw)
+        samples["_parse"].append(seconds)
+        
+        _, seconds = timed(generator._connect_all_floors, level.copy())
+        samples["_connect_all_floors"].append(seconds)
+        
+        _, seconds = timed(generator._fix_level, level)
+        samples["_fix_level"].append(seconds)
+        
+        _, seconds = timed(generator._fix_entity_counts, level, num_treasures, num_monsters)
+        samples["_fix_entity_counts"].append(seconds)
+        
+        analysis, seconds = timed(lambda: LevelValidator(level).analyze())
+        samples["LevelValidator"].append(seconds)
+        playable += analysis.playable
+        finished.append(level.to_rows())
+    
+    # Warm up first so NumPy's import isn't counted in the first batch
+    evaluator.evaluate_batch(finished[:batch_size])
+    for start in range(0, len(finished), batch_size):
+        batch = finished[start:start + batch_size]
+        _, seconds = timed(evaluator.evaluate_batch, batch)
+        samples["evaluate_batch"].extend([seconds / len(batch)] * len(batch))
+    
+    return {
+        'size': f"{width}x{height}",
+        'levels': levels,
+        'playable_rate': round(playable / levels, 3),
+        'stages': {stage: percentiles(times) for stage, times in samples.items()},
+    }
+
+
+def bench_model(model_name=None, rounds=3, seed=0):
+    """
+    Time the real model on the generation prompts.
+    
+    Works with any engine backend: the engine is only called through
+    generate_batch, and prefill and generation times and token counts
+    are read from the llm_* metrics the engines report. Decode time is
+    generation time minus prefill time. Prompts whose prefill the
+    engine already has cached skip the prefill, so the prefill rate is
+    over the prefills that actually ran. Outputs go through the normal
+    repair pipeline to count attempts per playable level.
+    """
+    from model_registry import get_engine
+    from instrumentation import MetricsCollector
+    
+    random.seed(seed)
+    engine = get_engine(model_name) if model_name else get_engine()
+    generator = LevelGenerator(engine)
+    
+    metrics = MetricsCollector().install()
+    attempts = playable = 0
+    try:
+        for _ in range(rounds):
+            for diff in DIFFICULTIES:
+                settings, num_treasures, num_monsters = generator._get_settings(diff)
+                prompt = generator._build_prompt(diff, settings, num_treasures, num_monsters)
+                raw = engine.generate_batch([prompt], 1, seed=seed + attempts)[0][0]
+                
+                _, ok = generator._process(raw, num_treasures, num_monsters)
+                attempts += 1
+                playable += ok
+    finally:
+        metrics.uninstall()
+    
+    def total(name):
+        histogram = metrics.histograms.get((name, ()))
+        return (histogram.sum, histogram.count) if histogram else (0.0, 0)
+    
+    generate_time, _ = total("llm_generate_seconds")
+    prefill_time, prefills = total("llm_prefill_seconds")
+    prompt_tokens, _ = total("llm_prompt_tokens")
+    new_tokens, _ = total("llm_new_tokens")
+    decode_time = max(generate_time - prefill_time, 0.0)
+    
+    return {
+        'model': engine.model_name,
+        'backend': ENGINE_BACKEND,
+        'device': engine.device,
+        'generations': attempts,
+        'prefills': prefills,
+        'prefill_tokens_per_sec': round(prompt_tokens / attempts * prefills / prefill_time, 1) if prefill_time else None,
+        'decode_tokens_per_sec': round(new_tokens / decode_time, 1) if decode_time else None,
+        'avg_prefill_sec': round(prefill_time / prefills, 3) if prefills else None,
+        'avg_decode_sec': round(decode_time / attempts, 3),
+        'avg_new_tokens': round(new_tokens / attempts, 1),
+        'attempts_per_playable': round(attempts / playable, 2) if playable else None,
+    }
+
+
+def print_pipeline(result, baseline=None):
+    """Print one grid size's stage table, with the change against a baseline run if given."""
+    print(f"\n{result['size']}: {result['levels']} levels, {result['playable_rate']:.0%} playable after repair")
+    print(f"{'stage':<22}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'per sec':>12}{'vs base':>10}")
+    for stage, stats in result['stages'].items():
+        change = ""
+        if baseline and stage in baseline['stages']:
+            before = baseline['stages'][stage]['p50_us']
+            if before:
+                change = f"{stats['p50_us'] / before:.2f}x"
+        print(f"{stage:<22}{stats['p50_us']:>10}{stats['p90_us']:>10}{stats['p99_us']:>10}{stats['per_sec']:>12}{change:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the level generation pipeline.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="grid sizes, e.g. 20x12,40x24")
+    parser.add_argument("--levels", type=int, default=200, help="stub outputs per grid size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--malformed", type=float, default=0.3, help="share of broken stub outputs")
+    parser.add_argument("--model", nargs="?", const="", default=None,
+                        help="also benchmark the real model (optionally a model name or path)")
+    parser.add_argument("--rounds", type=int, default=3, help="model generations per difficulty")
+    parser.add_argument("--save", help="write the results to a JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier --save to compare against")
+    args = parser.parse_args()
+    
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {r['size']: r for r in json.load(f)['pipeline']}
+    
+    results = {'pipeline': [], 'model': None}
+    for size in args.sizes.split(','):
+        width, height = (int(n) for n in size.lower().split('x'))
+        result = bench_pipeline(width, height, args.levels, args.seed, args.malformed)
+        results['pipeline'].append(result)
+        print_pipeline(result, baseline.get(result['size']))
+    
+    if args.model is not None:
+        results['model'] = bench_model(args.model or None, args.rounds, args.seed)
+        print("\nModel:")
+        for key, value in results['model'].items():
+            print(f"  {key}: {value}")
+    
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
@@ -1,15 +1,79 @@
 # Configuration for the Level Generator
 
-import torch
-
 # Model settings
 MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Inference backend: "torch" (PyTorch) or "onnx" (ONNX Runtime, exported on first use)
+ENGINE_BACKEND = "torch"
+# Where exported ONNX models are kept
+ONNX_DIR = "onnx_models"
+# "cuda", "cpu", or "auto" to use the GPU when there is one (resolved when the model loads)
+DEVICE = "auto"
+
+# CPU inference: "fp32", "int8" (dynamic quantization of linear layers) or "bf16"
+CPU_PRECISION = "fp32"
+# Wrap the model's forward pass in torch.compile
+COMPILE_MODEL = False
+# Thread counts for PyTorch (None keeps its defaults)
+INTRA_OP_THREADS = None
+INTER_OP_THREADS = None
+# Faster modes must match this share of fp32 next-token predictions
+MIN_FP32_AGREEMENT = 0.9
 
 # Generation settings
 MAX_TOKENS = 512
 TEMPERATURE = 0.8
 
+# Max sequences decoded together in one batched call
+BATCH_SIZE = 8
+
+# Candidates decoded together by LevelGenerator.generate_speculative
+SPECULATIVE_CANDIDATES = 4
+
+# Worker processes for WorkerPool (None: up to 4, since each may hold its own copy of the
+# weights) and torch threads for each (None: the cores split evenly); PIN_WORKERS binds
+# each worker to its own cores
+WORKER_PROCESSES = None
+WORKER_THREADS = None
+PIN_WORKERS = False
+
+# Stop decoding once a full grid has been generated
+EARLY_STOP = True
+
+# Prompts whose prefilled KV cache is kept for reuse (0 disables)
+PROMPT_CACHE_SIZE = 8
+
+# Mask the logits so the model can only write a well-formed grid
+CONSTRAINED_DECODING = False
+
+# Seed for generation (None keeps sampling random); the n-th call with the same batch of
+# prompts uses seed + n
+GENERATION_SEED = None
+
+# Directory for cached raw LLM outputs, replayed on reruns (None disables), and its size limit.
+# Caching is seeded generation: with GENERATION_SEED None it uses seed 0, so every run (and
+# every generator) makes the same levels. Reruns only hit the cache for batches of the same shape.
+OUTPUT_CACHE_DIR = None
+OUTPUT_CACHE_MAX_MB = 256
+# Replay OUTPUT_CACHE_DIR without loading the model at all (a miss raises KeyError)
+OUTPUT_CACHE_REPLAY = False
+
+# Backend for guaranteed playable levels when the LLM fails: "procedural" or "fixed" layouts
+FALLBACK_BACKEND = "procedural"
+
+# Level pool: ready levels kept per difficulty, saved between runs
+POOL_HIGH_WATER = 5
+POOL_PATH = "level_pool.json"
+
+# Level service: address, and how long a request may wait for others to batch with
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_WAIT_MS = 20
+# With this many requests queued, new ones get procedural levels instead (None never degrades)
+SERVICE_DEGRADE_QUEUE = 32
+
+# Levels this similar (estimated Jaccard of 2x2 patches) count as repeats
+DEDUP_THRESHOLD = 0.8
+
 # Level settings
 LEVEL_WIDTH = 20
 LEVEL_HEIGHT = 12
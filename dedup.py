@@ -0,0 +1,108 @@
+# Deduplication - spots repeated and near-repeated levels
+
+import hashlib
+
+import numpy as np
+
+from batch_validator import stack_levels
+from config import DEDUP_THRESHOLD
+
+# Mersenne prime for the MinHash permutations (a * x + b) mod PRIME
+PRIME = (1 << 31) - 1
+
+
+class LevelDeduplicator:
+    """
+    Rejects levels that were already seen, exactly or nearly.
+    
+    Exact repeats are caught by hashing a canonical form of the level:
+    optionally the smallest of its mirror images, and optionally with
+    every non-wall tile turned into floor so only the layout counts.
+    Near repeats are caught with MinHash over 2x2 tile patches at their
+    positions, stored in an LSH index (bands of the signature used as
+    bucket keys), so each check only compares against a handful of
+    candidates no matter how many levels have been added.
+    """
+    
+    def __init__(self, mirror_invariant=True, ignore_entities=False, threshold=DEDUP_THRESHOLD,
+                 num_perm=64, bands=16, seed=1):
+        self.mirror_invariant = mirror_invariant
+        self.ignore_entities = ignore_entities
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+        
+        self.hashes = set()
+        self.signatures = []
+        self.buckets = [{} for _ in range(bands)]
+    
+    def __len__(self):
+        return len(self.hashes)
+    
+    def _grids(self, level):
+        """The level as a 2D array, plus its mirror images if those count as the same."""
+        grid = stack_levels([level])[0]
+        if self.ignore_entities:
+            grid = np.where(grid == ord('#'), ord('#'), ord('.')).astype(np.uint8)
+        if not self.mirror_invariant:
+            return [grid]
+        return [grid, grid[:, ::-1], grid[::-1, :], grid[::-1, ::-1]]
+    
+    def fingerprint(self, level):
+        """Hash of the level's canonical form."""
+        canonical = min(grid.tobytes() for grid in self._grids(level))
+        return hashlib.blake2b(canonical, digest_size=16).digest()
+    
+    def signature(self, level):
+        """MinHash signature over the level's positioned 2x2 patches."""
+        shingles = []
+        for grid in self._grids(level):
+            g = grid.astype(np.uint64)
+            patches = g[:-1, :-1] | (g[:-1, 1:] << 8) | (g[1:, :-1] << 16) | (g[1:, 1:] << 24)
+            positions = np.arange(patches.size, dtype=np.uint64).reshape(patches.shape)
+            shingles.append(((patches * 1000003 + positions) % PRIME).ravel())
+        shingles = np.unique(np.concatenate(shingles))
+        
+        hashed = (self.perm_a[:, None] * shingles[None, :] + self.perm_b[:, None]) % PRIME
+        return hashed.min(axis=1)
+    
+    def _band_keys(self, signature):
+        """LSH bucket key for each band of a signature."""
+        r = self.rows_per_band
+        return [signature[b * r:(b + 1) * r].tobytes() for b in range(self.bands)]
+    
+    def check(self, level):
+        """Return 'exact' or 'near' if the level repeats one already added, else None."""
+        if self.fingerprint(level) in self.hashes:
+            return "exact"
+        return "near" if self._near_match(self.signature(level)) else None
+    
+    def _near_match(self, signature):
+        """Check LSH candidates for an estimated Jaccard similarity above the threshold."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        for idx in candidates:
+            if np.mean(self.signatures[idx] == signature) >= self.threshold:
+                return True
+        return False
+    
+    def add(self, level):
+        """Add a level unless it repeats one already seen. Returns True if it was new."""
+        fingerprint = self.fingerprint(level)
+        if fingerprint in self.hashes:
+            return False
+        signature = self.signature(level)
+        if self._near_match(signature):
+            return False
+        
+        self.hashes.add(fingerprint)
+        idx = len(self.signatures)
+        self.signatures.append(signature)
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(idx)
+        return True
@@ -0,0 +1,71 @@
+# Engine Base - what every text generation backend provides
+
+from abc import ABC, abstractmethod
+
+from config import MODEL_NAME, LEVEL_WIDTH, LEVEL_HEIGHT, TILES
+
+# Token spellings of a line break (SentencePiece byte token, GPT-2 style byte)
+NEWLINE_TOKENS = ("<0x0A>", "\u010a", "\n")
+
+
+def is_tile_row(line):
+    """Check if a line of output is a row of level tiles."""
+    chars = ''.join(line.split())
+    return bool(chars) and all(c in TILES for c in chars)
+
+
+def scan_rows(text):
+    """
+    Split generated text into finished tile rows.
+    
+    Only newline-terminated lines count. Text before the first tile
+    row is skipped; a non-tile line after the grid has started means
+    the model has drifted into prose.
+    Returns (rows, drifted).
+    """
+    rows = []
+    for line in text.split('\n')[:-1]:
+        if is_tile_row(line):
+            rows.append(''.join(line.split()))
+        elif rows and line.strip():
+            return rows, True
+    return rows, False
+
+
+def grid_finished(text, width=LEVEL_WIDTH, height=LEVEL_HEIGHT):
+    """Check if the generated text already holds a full grid (or has drifted off it)."""
+    rows, drifted = scan_rows(text)
+    if drifted or len(rows) >= height:
+        return True
+    
+    # The last row is done once it is full width, no need to wait for the newline
+    partial = text.split('\n')[-1]
+    return len(rows) == height - 1 and is_tile_row(partial) and len(''.join(partial.split())) >= width
+
+
+class Engine(ABC):
+    """
+    Interface LevelGenerator uses to get text from a model.
+    
+    Backends implement generate_batch; generate() and generate_stream()
+    are built on it unless a backend has something faster.
+    """
+    
+    model_name = MODEL_NAME
+    
+    @abstractmethod
+    def generate_batch(self, prompts, n_per_prompt=1, seed=None):
+        """Generate n_per_prompt outputs for each prompt. Returns one list of strings per prompt."""
+    
+    def generate(self, prompt):
+        """Generate text from a prompt."""
+        return self.generate_batch([prompt])[0][0]
+    
+    def generate_stream(self, prompt):
+        """Yield the level rows of one output."""
+        rows, _ = scan_rows(self.generate(prompt) + '\n')
+        yield from rows[:LEVEL_HEIGHT]
+    
+    def sampling_params(self):
+        """Settings that change what the model outputs, part of the output cache key."""
+        return {}
@@ -7,17 +7,58 @@ class LevelEvaluator:
     
     def evaluate(self, level):
         """Calculate metrics for a single level."""
-        validator = LevelValidator(level)
+        # One scan and one BFS for both playability and connectivity
+        analysis = LevelValidator(level).analyze()
         
-        playable, msg = validator.is_playable()
-        connectivity = validator.get_connectivity()
+        return self._metrics(level, analysis.playable, analysis.message, analysis.connectivity)
+    
+    def evaluate_all(self, levels):
+        """Calculate metrics for many levels, validating them together in one batch."""
+        # An (N, H, W) array of tile codes, as stored in a LevelArchive
+        if hasattr(levels, "shape"):
+            return self.evaluate_tiles(levels)
+        if not levels:
+            return []
+        
+        # The batch validator needs one grid size, otherwise go level by level
+        if len(set((len(level), len(level[0])) for level in levels)) > 1:
+            return [self.evaluate(level) for level in levels]
+        
+        # NumPy is only loaded once a batch is actually evaluated
+        from batch_validator import BatchValidator
+        
+        validator = BatchValidator(levels)
+        checks = validator.is_playable()
+        connectivities = validator.get_connectivity()
+        
+        return [self._metrics(level, playable, msg, connectivity)
+                for level, (playable, msg), connectivity in zip(levels, checks, connectivities)]
+    
+    def evaluate_tiles(self, tiles):
+        """Calculate metrics for an (N, H, W) array of tile codes, counting entities on the array."""
+        if len(tiles) == 0:
+            return []
         
+        from batch_validator import BatchValidator
+        
+        validator = BatchValidator(tiles)
+        checks = validator.is_playable()
+        connectivities = validator.get_connectivity()
+        flat = validator.tiles.reshape(validator.count, -1)
+        monsters = (flat == ord('M')).sum(axis=1)
+        treasures = (flat == ord('T')).sum(axis=1)
+        
+        return [self._score(playable, msg, connectivity, int(m), int(t), flat.shape[1])
+                for (playable, msg), connectivity, m, t in zip(checks, connectivities, monsters, treasures)]
+    
+    def _metrics(self, level, playable, msg, connectivity):
+        """Count the entities of a level and build its metrics dict."""
         # Count elements
         level_str = ''.join(level)
-        monsters = level_str.count('M')
-        treasures = level_str.count('T')
-        total_tiles = len(level_str)
-        
+        return self._score(playable, msg, connectivity, level_str.count('M'), level_str.count('T'), len(level_str))
+    
+    def _score(self, playable, msg, connectivity, monsters, treasures, total_tiles):
+        """Build the metrics dict from validation results and entity counts."""
         # Calculate scores
         metrics = {
             'playable': playable,
@@ -43,7 +84,7 @@ class LevelEvaluator:
     
     def evaluate_batch(self, levels):
         """Evaluate multiple levels and calculate averages."""
-        results = [self.evaluate(level) for level in levels]
+        results = self.evaluate_all(levels)
         
         playable_count = sum(1 for r in results if r['playable'])
         avg_score = sum(r['score'] for r in results) / len(results)
@@ -0,0 +1,49 @@
+# Import Check - makes sure validation and evaluation start without the ML libraries
+
+import os
+import subprocess
+import sys
+
+# Modules that must import without pulling in torch, transformers or numpy
+LIGHT_MODULES = ["config", "level", "validator", "evaluator", "level_generator", "level_pool", "main"]
+HEAVY_MODULES = ["torch", "transformers", "numpy"]
+
+# Import time budget for all light modules together, in seconds
+MAX_IMPORT_SECONDS = 0.5
+
+
+def check_imports():
+    """
+    Import the light modules in a fresh interpreter.
+    
+    Returns (seconds, heavy modules that got loaded). A fresh process
+    is used so nothing already imported here hides a regression.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {', '.join(LIGHT_MODULES)}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True).stdout
+    seconds, loaded = output.split('\n')[:2]
+    return float(seconds), [m for m in loaded.split(',') if m]
+
+
+if __name__ == "__main__":
+    seconds, loaded = check_imports()
+    print(f"Imported {', '.join(LIGHT_MODULES)} in {seconds * 1000:.1f} ms")
+    
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy modules loaded at import time: {', '.join(loaded)}")
+        failed = True
+    if seconds > MAX_IMPORT_SECONDS:
+        print(f"FAIL: slower than the {MAX_IMPORT_SECONDS * 1000:.0f} ms budget")
+        failed = True
+    
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,183 @@
+# Instrumentation - timing and counting hooks for the generation pipeline
+
+import threading
+import time
+
+# Hooks are called as hook(kind, name, value, labels), kind is "observe" or "count"
+_hooks = []
+
+# Histogram upper bounds for timings (seconds) and for sizes/counts
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+def add_hook(hook):
+    """Start sending pipeline events to a hook."""
+    if hook not in _hooks:
+        _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    """Stop sending events to a hook."""
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def enabled():
+    """Check if any hook is listening, to skip work that only feeds metrics."""
+    return bool(_hooks)
+
+
+def observe(name, value, **labels):
+    """Record one measurement (a duration, a token count, ...)."""
+    for hook in _hooks:
+        hook("observe", name, value, labels)
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter."""
+    if amount:
+        for hook in _hooks:
+            hook("count", name, amount, labels)
+
+
+class timer:
+    """Context manager that observes how long its block took, in seconds."""
+    
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+    
+    def __enter__(self):
+        if _hooks:
+            self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def stage(name):
+    """Time one stage of the pipeline as stage_seconds{stage=name}."""
+    return timer("stage_seconds", stage=name)
+
+
+class Histogram:
+    """Bucketed distribution of observed values."""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def add(self, value):
+        for k, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            k = len(self.buckets)
+        self.counts[k] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        """(upper bound, observations at or below it) per bucket, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, n in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+
+class MetricsCollector:
+    """
+    Hook that aggregates pipeline events in memory.
+    
+    Measurements go into histograms (time buckets for names ending in
+    _seconds, count buckets otherwise) and counts into counters, one
+    series per name and label set. The totals can be exported as JSON
+    or in the Prometheus text format.
+    """
+    
+    def __init__(self, prefix="levelcrafter"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+    
+    def __call__(self, kind, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if kind == "count":
+                self.counters[key] = self.counters.get(key, 0) + value
+                return
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                buckets = TIME_BUCKETS if name.endswith("_seconds") else COUNT_BUCKETS
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.add(value)
+    
+    def install(self):
+        """Register this collector as a hook. Returns the collector."""
+        add_hook(self)
+        return self
+    
+    def uninstall(self):
+        remove_hook(self)
+    
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+    
+    def to_json(self):
+        """All metrics as a JSON-ready dict."""
+        with self.lock:
+            histograms = [{
+                'name': name,
+                'labels': dict(labels),
+                'count': h.count,
+                'sum': h.sum,
+                'mean': h.sum / h.count if h.count else 0.0,
+                'buckets': [[bound if bound != float("inf") else "+Inf", n] for bound, n in h.cumulative()],
+            } for (name, labels), h in sorted(self.histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+        return {'histograms': histograms, 'counters': counters}
+    
+    def to_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+        
+        def series(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return name
+            return name + "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+        
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                full = f"{self.prefix}_{name}"
+                if full not in typed:
+                    lines.append(f"# TYPE {full} counter")
+                    typed.add(full)
+                lines.append(f"{series(full, labels)} {value}")
+            
+            for (name, labels), h in sorted(self.histograms.items()):
+                full = f"{self.prefix}_{name}"
+                if full not in typed:
+                    lines.append(f"# TYPE {full} histogram")
+                    typed.add(full)
+                for bound, n in h.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{series(full + '_bucket', labels, [('le', le)])} {n}")
+                lines.append(f"{series(full + '_sum', labels)} {h.sum}")
+                lines.append(f"{series(full + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,130 @@
+# Level - compact grid shared by the generator, validator and evaluator
+
+WALL = ord('#')
+
+
+class Level:
+    """
+    A level grid stored as one contiguous bytearray, row by row.
+    
+    Keeps an index of where every non-wall tile is and a walkable mask,
+    both built on first use and updated on every set(), so the pipeline
+    stages can share one Level and edit it in place without copying
+    or rescanning the grid. Indexing and iterating give the rows as
+    strings, like the plain list-of-strings format.
+    """
+    
+    __slots__ = ('width', 'height', 'tiles', '_walkable', '_index')
+    
+    def __init__(self, rows):
+        self.height = len(rows)
+        self.width = len(rows[0])
+        self.tiles = bytearray(''.join(rows).encode('ascii'))
+        self._walkable = None
+        self._index = None
+    
+    @classmethod
+    def from_buffer(cls, buf, width, height):
+        """Build a level from a flat buffer of tile bytes, e.g. a NumPy array."""
+        level = cls.__new__(cls)
+        level.width = width
+        level.height = height
+        level.tiles = bytearray(buf)
+        level._walkable = None
+        level._index = None
+        return level
+    
+    def copy(self):
+        """Return an independent copy of the level."""
+        level = Level.__new__(Level)
+        level.width = self.width
+        level.height = self.height
+        level.tiles = bytearray(self.tiles)
+        level._walkable = None
+        level._index = None
+        return level
+    
+    def to_rows(self):
+        """Return the level as a list of strings."""
+        return [self[i] for i in range(self.height)]
+    
+    def __len__(self):
+        return self.height
+    
+    def __getitem__(self, i):
+        # Same rules as indexing a list of rows: slices, negative indices, IndexError
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.height))]
+        if i < 0:
+            i += self.height
+        if not 0 <= i < self.height:
+            raise IndexError("level row index out of range")
+        start = i * self.width
+        return self.tiles[start:start + self.width].decode('ascii')
+    
+    def __iter__(self):
+        return iter(self.to_rows())
+    
+    def get(self, i, j):
+        """Get the tile at row i, column j."""
+        return chr(self.tiles[i * self.width + j])
+    
+    def set(self, i, j, char):
+        """Set the tile at row i, column j, keeping the index and mask in sync."""
+        idx = i * self.width + j
+        old = self.tiles[idx]
+        new = ord(char)
+        if old == new:
+            return
+        self.tiles[idx] = new
+        
+        if self._index is not None:
+            if old != WALL:
+                self._index[chr(old)].discard(idx)
+            if new != WALL:
+                self._index.setdefault(char, set()).add(idx)
+        if self._walkable is not None:
+            self._walkable[idx] = new != WALL
+    
+    @property
+    def walkable(self):
+        """Bytearray mask, 1 where the tile is not a wall."""
+        if self._walkable is None:
+            self._walkable = bytearray(t != WALL for t in self.tiles)
+        return self._walkable
+    
+    def _positions_index(self):
+        """Map each non-wall tile to the set of flat indices holding it."""
+        if self._index is None:
+            self._index = {}
+            for idx, t in enumerate(self.tiles):
+                if t != WALL:
+                    self._index.setdefault(chr(t), set()).add(idx)
+        return self._index
+    
+    def positions(self, char):
+        """All (i, j) positions of a non-wall tile, in row-major order."""
+        return [divmod(idx, self.width) for idx in sorted(self._positions_index().get(char, ()))]
+    
+    def find(self, char):
+        """First (i, j) position of a non-wall tile in row-major order, or None."""
+        found = self._positions_index().get(char)
+        if not found:
+            return None
+        return divmod(min(found), self.width)
+    
+    def count(self, char):
+        """Number of tiles of one kind."""
+        if char == '#':
+            return self.tiles.count(WALL)
+        return len(self._positions_index().get(char, ()))
+    
+    def is_walkable(self, i, j):
+        """Check if position is inside the level and not a wall."""
+        if 0 <= i < self.height and 0 <= j < self.width:
+            return self.tiles[i * self.width + j] != WALL
+        return False
+    
+    def walkable_count(self):
+        """Number of non-wall tiles."""
+        return len(self.tiles) - self.tiles.count(WALL)
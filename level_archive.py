@@ -0,0 +1,200 @@
+# Level Archive - compact on-disk storage for large level corpora
+
+import os
+import struct
+
+import numpy as np
+
+from config import TILES
+from level import Level
+from evaluator import LevelEvaluator
+from batch_validator import stack_levels
+
+MAGIC = b"LVLA"
+VERSION = 1
+# magic, version, width, height, record size in bytes
+HEADER = struct.Struct("<4sHHHI")
+
+DIFFICULTIES = ("easy", "medium", "hard")
+UNKNOWN_DIFFICULTY = 255
+
+# One fixed-size index entry per level, kept in a side file (<path>.idx)
+INDEX_DTYPE = np.dtype([
+    ("difficulty", "u1"),
+    ("playable", "u1"),
+    ("treasures", "<u2"),
+    ("monsters", "<u2"),
+    ("score", "<f4"),
+    ("connectivity", "<f4"),
+])
+
+# Tile character <-> 3-bit code
+TILE_CODES = np.full(256, 0, dtype=np.uint8)
+for code, char in enumerate(TILES):
+    TILE_CODES[ord(char)] = code
+TILE_CHARS = np.frombuffer(''.join(TILES).encode('ascii'), dtype=np.uint8)
+
+
+def pack_tiles(tiles):
+    """
+    Pack an (N, H, W) array of tile characters into 3 bits per tile.
+    
+    Every 8 tiles become 3 bytes; the last group of a level is padded.
+    Returns an (N, record_size) uint8 array.
+    """
+    count = tiles.shape[0]
+    codes = TILE_CODES[tiles.reshape(count, -1)].astype(np.uint32)
+    groups = -(-codes.shape[1] // 8)
+    padded = np.zeros((count, groups * 8), dtype=np.uint32)
+    padded[:, :codes.shape[1]] = codes
+    
+    # 8 codes of 3 bits -> one 24-bit value -> 3 bytes
+    values = (padded.reshape(count, groups, 8) << (3 * np.arange(8, dtype=np.uint32))).sum(axis=2, dtype=np.uint32)
+    packed = np.stack([values & 0xFF, (values >> 8) & 0xFF, (values >> 16) & 0xFF], axis=2)
+    return packed.astype(np.uint8).reshape(count, groups * 3)
+
+
+def unpack_tiles(packed, width, height):
+    """Unpack (N, record_size) records into an (N, H, W) array of tile characters."""
+    count = packed.shape[0]
+    triples = packed.reshape(count, -1, 3).astype(np.uint32)
+    values = triples[:, :, 0] | (triples[:, :, 1] << 8) | (triples[:, :, 2] << 16)
+    codes = (values[:, :, None] >> (3 * np.arange(8, dtype=np.uint32))) & 7
+    codes = codes.reshape(count, -1)[:, :width * height]
+    return TILE_CHARS[codes].reshape(count, height, width)
+
+
+class LevelArchive:
+    """
+    Fixed-size, bit-packed level records plus a side index, read through mmap.
+    
+    Levels are stored at 3 bits per tile in <path>, after a small
+    header. <path>.idx holds difficulty, playability, score,
+    connectivity and entity counts per level. Both files are opened
+    with np.memmap, so queries and slices only touch the pages they
+    need and nothing is parsed or loaded up front. The index is read
+    in place; tiles are not, since unpacking the 3-bit records always
+    builds a new array for the slice asked for.
+    """
+    
+    def __init__(self, path, width=None, height=None):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._data = None
+        self._index = None
+        
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                magic, version, self.width, self.height, self.record_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} level archive")
+            if (width, height) not in ((None, None), (self.width, self.height)):
+                raise ValueError(f"{path} holds {self.width}x{self.height} levels, not {width}x{height}")
+        else:
+            if width is None or height is None:
+                raise ValueError("width and height are needed to create a new archive")
+            self.width = width
+            self.height = height
+            self.record_size = -(-width * height // 8) * 3
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, width, height, self.record_size))
+            open(self.index_path, "wb").close()
+    
+    def __len__(self):
+        data_count = (os.path.getsize(self.path) - HEADER.size) // self.record_size
+        index_count = os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+        return min(data_count, index_count)
+    
+    def append(self, levels, difficulty=None, metrics=None):
+        """
+        Add levels to the archive.
+        
+        levels can be a list of levels or an (N, H, W) array of tile
+        codes. metrics are LevelEvaluator results, one per level; they
+        are computed in one batch on the tile array if not given.
+        """
+        if not len(levels):
+            return
+        
+        tiles = levels if isinstance(levels, np.ndarray) else stack_levels(levels)
+        if tiles.shape[1:] != (self.height, self.width):
+            raise ValueError(f"archive holds {self.width}x{self.height} levels")
+        if metrics is None:
+            metrics = LevelEvaluator().evaluate_tiles(tiles)
+        
+        index = np.zeros(len(metrics), dtype=INDEX_DTYPE)
+        index["difficulty"] = DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else UNKNOWN_DIFFICULTY
+        index["playable"] = [m["playable"] for m in metrics]
+        index["treasures"] = [m["treasures"] for m in metrics]
+        index["monsters"] = [m["monsters"] for m in metrics]
+        index["score"] = [m["score"] for m in metrics]
+        index["connectivity"] = [m["connectivity"] for m in metrics]
+        
+        with open(self.path, "ab") as f:
+            f.write(pack_tiles(tiles).tobytes())
+        with open(self.index_path, "ab") as f:
+            f.write(index.tobytes())
+        
+        # The maps no longer cover the whole file
+        self._data = None
+        self._index = None
+    
+    def _maps(self):
+        """Memory-map the records and the index (read-only)."""
+        if self._data is None:
+            count = len(self)
+            if count == 0:
+                self._data = np.zeros((0, self.record_size), dtype=np.uint8)
+                self._index = np.zeros(0, dtype=INDEX_DTYPE)
+            else:
+                self._data = np.memmap(self.path, dtype=np.uint8, mode="r", offset=HEADER.size,
+                                       shape=(count, self.record_size))
+                self._index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+        return self._data, self._index
+    
+    @property
+    def index(self):
+        """The memory-mapped index as a NumPy structured array."""
+        return self._maps()[1]
+    
+    def tiles(self, selection=slice(None)):
+        """
+        Tile arrays for a slice or an array of level numbers.
+        
+        Returns a new (N, H, W) uint8 array of tile characters (a copy,
+        unpacked from the mapped records), which BatchValidator accepts
+        directly.
+        """
+        data, _ = self._maps()
+        return unpack_tiles(np.asarray(data[selection]), self.width, self.height)
+    
+    def get(self, n):
+        """One level as a Level, ready for LevelValidator."""
+        return Level.from_buffer(self.tiles(slice(n, n + 1))[0], self.width, self.height)
+    
+    def levels(self, selection=slice(None)):
+        """Levels as lists of strings."""
+        return [[row.tobytes().decode('ascii') for row in grid] for grid in self.tiles(selection)]
+    
+    def query(self, difficulty=None, playable=None, min_score=None, min_connectivity=None):
+        """Level numbers matching all given conditions, straight from the index."""
+        index = self.index
+        mask = np.ones(len(index), dtype=bool)
+        if difficulty is not None:
+            mask &= index["difficulty"] == DIFFICULTIES.index(difficulty)
+        if playable is not None:
+            mask &= index["playable"] == int(playable)
+        if min_score is not None:
+            mask &= index["score"] >= min_score
+        if min_connectivity is not None:
+            mask &= index["connectivity"] >= min_connectivity
+        return np.nonzero(mask)[0]
+    
+    def iter_batches(self, batch_size=1024, selection=None):
+        """Stream tile arrays in batches, optionally only for the given level numbers."""
+        if selection is None:
+            for start in range(0, len(self), batch_size):
+                yield self.tiles(slice(start, start + batch_size))
+        else:
+            for start in range(0, len(selection), batch_size):
+                yield self.tiles(selection[start:start + batch_size])
@@ -0,0 +1,155 @@
+# Level Editor - editable level that keeps its validation up to date
+
+from collections import deque
+
+from level import Level
+from validator import LevelValidator
+
+# The 8 tiles around a tile, in order around the ring; odd positions share an edge with it
+RING = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+
+class EditableLevel:
+    """
+    A level that can be edited tile by tile, with undo.
+    
+    Keeps the set of tiles reachable from the player and updates it
+    from the changed tile after every edit instead of running a new
+    BFS. Opening a wall next to the reachable area floods only the
+    newly reached tiles. Closing a reachable tile is usually settled
+    by looking at the 8 tiles around it. The whole area is searched
+    again only when the player moves or a wall really may have cut
+    the area in two.
+    """
+    
+    def __init__(self, level):
+        # A Level is edited in place, plain rows are converted once
+        self.level = level if isinstance(level, Level) else Level(level)
+        self.history = []
+        self.walkable_count = self.level.walkable_count()
+        self._recompute()
+    
+    def _recompute(self):
+        """BFS from the player over the whole level."""
+        self.player = self.level.find('P')
+        if self.player:
+            order, self.reached = LevelValidator(self.level)._flood(self.player)
+            self.reachable_count = len(order)
+        else:
+            self.reached = bytearray(len(self.level.tiles))
+            self.reachable_count = 0
+    
+    def get(self, i, j):
+        """Get the tile at row i, column j."""
+        return self.level.get(i, j)
+    
+    def set_tile(self, i, j, char, record=True):
+        """Change one tile and update reachability. Returns the old tile."""
+        level = self.level
+        old = level.get(i, j)
+        if old == char:
+            return old
+        if record:
+            self.history.append((i, j, old))
+        
+        idx = i * level.width + j
+        was_walkable = old != '#'
+        now_walkable = char != '#'
+        level.set(i, j, char)
+        self.walkable_count += now_walkable - was_walkable
+        
+        # The player is the first P in row-major order, like in LevelValidator
+        if (char == 'P' or old == 'P') and level.find('P') != self.player:
+            self._recompute()
+        elif now_walkable and not was_walkable:
+            if any(self.reached[n] for n in self._neighbors(idx)):
+                self._flood_from(idx)
+        elif was_walkable and not now_walkable and self.reached[idx]:
+            self.reached[idx] = 0
+            self.reachable_count -= 1
+            if not self._locally_connected(i, j):
+                self._recompute()
+        return old
+    
+    def undo(self):
+        """Revert the last edit. Returns its (i, j), or None if there is nothing to undo."""
+        if not self.history:
+            return None
+        i, j, old = self.history.pop()
+        self.set_tile(i, j, old, record=False)
+        return i, j
+    
+    def _neighbors(self, idx):
+        """Flat indices of the 4 tiles next to idx that are inside the level."""
+        width = self.level.width
+        i, j = divmod(idx, width)
+        if i > 0:
+            yield idx - width
+        if i < self.level.height - 1:
+            yield idx + width
+        if j > 0:
+            yield idx - 1
+        if j < width - 1:
+            yield idx + 1
+    
+    def _flood_from(self, start):
+        """Mark start and every walkable tile it newly reaches."""
+        walkable = self.level.walkable
+        reached = self.reached
+        reached[start] = 1
+        queue = deque([start])
+        count = 1
+        while queue:
+            idx = queue.popleft()
+            for n in self._neighbors(idx):
+                if walkable[n] and not reached[n]:
+                    reached[n] = 1
+                    count += 1
+                    queue.append(n)
+        self.reachable_count += count
+    
+    def _locally_connected(self, i, j):
+        """
+        Check if the open neighbours of a just-closed tile still connect around it.
+        
+        Walks the ring of 8 tiles around (i, j): if all its open edge
+        neighbours sit on one unbroken run of open ring tiles, they are
+        still connected and nothing else was cut off.
+        """
+        level = self.level
+        ring = [level.is_walkable(i + di, j + dj) for di, dj in RING]
+        if sum(ring[1::2]) <= 1 or all(ring):
+            return True
+        
+        # Number the runs of open tiles, starting just after a closed one
+        start = ring.index(False)
+        run = 0
+        runs = set()
+        for k in range(1, 9):
+            pos = (start + k) % 8
+            if not ring[pos]:
+                run += 1
+            elif pos % 2:
+                runs.add(run)
+        return len(runs) <= 1
+    
+    def is_playable(self):
+        """Check if the player can reach the exit. Returns (playable, message) like LevelValidator."""
+        if not self.player:
+            return False, "No player start"
+        exit_pos = self.level.find('E')
+        if not exit_pos:
+            return False, "No exit"
+        if self.reached[exit_pos[0] * self.level.width + exit_pos[1]]:
+            return True, "Playable"
+        return False, "Exit not reachable"
+    
+    def get_connectivity(self):
+        """Fraction of walkable tiles reachable from the player."""
+        if not self.player or self.walkable_count == 0:
+            return 0.0
+        return self.reachable_count / self.walkable_count
+    
+    def to_rows(self):
+        """Return the level as a list of strings."""
+        return self.level.to_rows()
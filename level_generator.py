@@ -1,16 +1,36 @@
 # Level Generator - creates dungeon levels using the LLM
 
-from llm_engine import LLMEngine
-from validator import LevelValidator
-from config import PROMPT_TEMPLATE, LEVEL_WIDTH, LEVEL_HEIGHT, TILES
+from collections import deque
+
+from level import Level, WALL
+from regions import RegionMap
+from evaluator import LevelEvaluator
+from model_registry import get_engine
+from instrumentation import stage, observe, increment
+from config import PROMPT_TEMPLATE, LEVEL_WIDTH, LEVEL_HEIGHT, TILES, BATCH_SIZE, SPECULATIVE_CANDIDATES
+from config import GENERATION_SEED, OUTPUT_CACHE_DIR, OUTPUT_CACHE_REPLAY, FALLBACK_BACKEND
 
 class LevelGenerator:
     """Generates game levels using the LLM."""
     
-    def __init__(self):
-        self.llm = LLMEngine()
-        self.width = LEVEL_WIDTH
-        self.height = LEVEL_HEIGHT
+    def __init__(self, llm=None, width=LEVEL_WIDTH, height=LEVEL_HEIGHT, seed=GENERATION_SEED):
+        # Any engine_base.Engine works, by default the shared engine for
+        # ENGINE_BACKEND, which is loaded only once (not at all when only
+        # replaying the output cache)
+        replay = llm is None and OUTPUT_CACHE_DIR and OUTPUT_CACHE_REPLAY
+        self.llm = llm if llm is not None or replay else get_engine()
+        
+        # Seeded generation, with outputs cached on disk and replayed on reruns;
+        # a cache without a seed uses seed 0, see OUTPUT_CACHE_DIR in config
+        if seed is not None or OUTPUT_CACHE_DIR:
+            from output_cache import OutputCache, CachedEngine
+            cache = OutputCache(OUTPUT_CACHE_DIR) if OUTPUT_CACHE_DIR else None
+            self.llm = CachedEngine(self.llm, cache, seed or 0)
+        self.evaluator = LevelEvaluator()
+        self.width = width
+        self.height = height
+        # Non-LLM backend, created on first use
+        self.procedural = None
     
     # Difficulty settings: (num_treasures, num_monsters, corridor_width)
     DIFFICULTY_SETTINGS = {
@@ -19,55 +39,289 @@ class LevelGenerator:
         "hard": {"treasures": 2, "monsters": 6, "corridor_width": 1, "description": "narrow corridors, many monsters, few treasures, maze-like"}
     }
     
-    def generate(self, difficulty="medium", num_treasures=None, num_monsters=None):
-        """Generate a single playable level. Retries until playable."""
+    def generate(self, difficulty="medium", num_treasures=None, num_monsters=None, backend="llm"):
+        """Generate a single playable level. Retries until playable. backend="procedural" skips the LLM."""
+        if backend == "procedural":
+            increment("levels_total", source="procedural", difficulty=difficulty)
+            return self._procedural().generate(difficulty, num_treasures, num_monsters)
         
         # Get difficulty settings
-        settings = self.DIFFICULTY_SETTINGS.get(difficulty, self.DIFFICULTY_SETTINGS["medium"])
-        if num_treasures is None:
-            num_treasures = settings["treasures"]
-        if num_monsters is None:
-            num_monsters = settings["monsters"]
+        settings, num_treasures, num_monsters = self._get_settings(difficulty, num_treasures, num_monsters)
         
         max_attempts = 5
         
+        # Create the prompt once, retries reuse its cached prefill in the engine
+        with stage("prompt"):
+            prompt = self._build_prompt(difficulty, settings, num_treasures, num_monsters)
+        
         for attempt in range(max_attempts):
-            # Create the prompt
-            prompt = PROMPT_TEMPLATE.format(
-                difficulty=difficulty,
-                width=self.width,
-                height=self.height,
-                num_treasures=num_treasures,
-                num_monsters=num_monsters,
-                difficulty_description=settings["description"]
-            )
-            
             # Get LLM output
-            raw = self.llm.generate(prompt)
-            
-            # Parse and clean the output
-            level = self._parse(raw)
-            level = self._fix_level(level)
-            
-            # Fix treasure and monster counts
-            level = self._fix_entity_counts(level, num_treasures, num_monsters)
+            with stage("llm"):
+                raw = self.llm.generate(prompt)
             
-            # Check if playable
-            validator = LevelValidator(level)
-            playable, _ = validator.is_playable()
+            # Parse, clean and check the output
+            level, playable = self._process(raw, num_treasures, num_monsters)
             
             if playable:
+                observe("generate_attempts", attempt + 1)
+                increment("levels_total", source="llm", difficulty=difficulty)
                 return level
             
             print(f"  Attempt {attempt + 1} not playable, retrying...")
         
         # If all attempts failed, force a playable level
         print("  Creating guaranteed playable level...")
-        level = self._create_fallback_level(difficulty, num_treasures, num_monsters)
+        observe("generate_attempts", max_attempts)
+        increment("levels_total", source="fallback", difficulty=difficulty)
+        with stage("fallback"):
+            level = self._create_fallback_level(difficulty, num_treasures, num_monsters)
         return level
     
+    def generate_speculative(self, difficulty="medium", num_treasures=None, num_monsters=None,
+                             candidates=SPECULATIVE_CANDIDATES, pick_best=False):
+        """
+        Generate a single playable level from several candidates decoded at once.
+        
+        Instead of up to 5 sequential attempts, all candidates come out of
+        one batched LLM call, so latency is bounded by a single generation.
+        Candidates are repaired and validated in order: the first playable
+        one is returned and the rest are skipped, or with pick_best the
+        playable one with the highest LevelEvaluator score wins.
+        """
+        settings, num_treasures, num_monsters = self._get_settings(difficulty, num_treasures, num_monsters)
+        prompt = self._build_prompt(difficulty, settings, num_treasures, num_monsters)
+        
+        with stage("llm"):
+            raws = self.llm.generate_batch([prompt], candidates)[0]
+        
+        best_level = None
+        best_score = -1.0
+        for raw in raws:
+            level, playable = self._process(raw, num_treasures, num_monsters)
+            if not playable:
+                continue
+            if not pick_best:
+                increment("levels_total", source="llm", difficulty=difficulty)
+                return level
+            score = self.evaluator.evaluate(level)['score']
+            if score > best_score:
+                best_level, best_score = level, score
+        
+        if best_level is not None:
+            increment("levels_total", source="llm", difficulty=difficulty)
+            return best_level
+        
+        print(f"  No playable level in {candidates} candidates, creating guaranteed playable level...")
+        increment("levels_total", source="fallback", difficulty=difficulty)
+        return self._create_fallback_level(difficulty, num_treasures, num_monsters)
+    
+    def generate_many(self, difficulties, count=1, dedup=None, backend="llm"):
+        """
+        Generate count playable levels for each difficulty using batched LLM calls.
+        
+        All difficulties still needing levels are decoded together in one
+        generate_batch call per round. Each difficulty gets the same LLM
+        budget as count sequential generate() calls (5 outputs per level)
+        before falling back to guaranteed levels. With a LevelDeduplicator
+        as dedup, levels it has already seen are rejected like unplayable
+        ones, fallback levels included (a repeated fallback is swapped for
+        a procedural level, up to 5 times). backend="procedural" makes
+        them all without the LLM.
+        Returns the levels grouped in the order of difficulties.
+        """
+        if isinstance(difficulties, str):
+            difficulties = [difficulties]
+        if backend == "procedural":
+            levels = self._procedural().generate_many(difficulties, count, dedup)
+            increment("levels_total", len(levels), source="procedural")
+            return levels
+        
+        max_attempts = 5
+        
+        needed = {}
+        for diff in difficulties:
+            needed[diff] = needed.get(diff, 0) + count
+        budget = {diff: n * max_attempts for diff, n in needed.items()}
+        done = {diff: [] for diff in needed}
+        
+        while True:
+            pending = [d for d in needed if len(done[d]) < needed[d] and budget[d] > 0]
+            if not pending:
+                break
+            
+            # Share the batch between difficulties, one prompt per difficulty
+            n_per_prompt = max(1, BATCH_SIZE // len(pending))
+            n_per_prompt = min(n_per_prompt, max(needed[d] - len(done[d]) for d in pending))
+            
+            prompts = []
+            for diff in pending:
+                settings, num_treasures, num_monsters = self._get_settings(diff)
+                prompts.append(self._build_prompt(diff, settings, num_treasures, num_monsters))
+            
+            with stage("llm"):
+                outputs = self.llm.generate_batch(prompts, n_per_prompt)
+            
+            for diff, raws in zip(pending, outputs):
+                _, num_treasures, num_monsters = self._get_settings(diff)
+                for raw in raws:
+                    if len(done[diff]) >= needed[diff] or budget[diff] <= 0:
+                        break
+                    budget[diff] -= 1
+                    level, playable = self._process(raw, num_treasures, num_monsters)
+                    if playable and (dedup is None or dedup.add(level)):
+                        done[diff].append(level)
+                        increment("levels_total", source="llm", difficulty=diff)
+        
+        # Fill anything still missing with guaranteed playable levels
+        for diff in needed:
+            missing = needed[diff] - len(done[diff])
+            if missing > 0:
+                print(f"  Creating {missing} guaranteed playable {diff} level(s)...")
+                increment("levels_total", missing, source="fallback", difficulty=diff)
+                _, num_treasures, num_monsters = self._get_settings(diff)
+                for _ in range(missing):
+                    level = self._create_fallback_level(diff, num_treasures, num_monsters)
+                    # The fixed layouts repeat, so the fill goes through dedup too; repeats
+                    # are replaced by procedural levels, and kept if those keep repeating
+                    if dedup is not None:
+                        for _ in range(max_attempts):
+                            if dedup.add(level):
+                                break
+                            level = self._procedural().generate(diff, num_treasures, num_monsters)
+                    done[diff].append(level)
+        
+        levels = []
+        for diff in difficulties:
+            levels.extend(done[diff][:count])
+            done[diff] = done[diff][count:]
+        return levels
+    
+    def generate_large(self, width, height, difficulty="medium", num_treasures=None, num_monsters=None):
+        """
+        Generate a large map by stitching together chunk-sized LLM levels.
+        
+        The map is split into chunks of the normal level size that share
+        their border walls, so every LLM call stays at the size the model
+        handles well. All chunks are generated together in batched calls,
+        stitched with a door opening in each shared seam, and then the
+        whole map is repaired once: one player and exit, every region
+        connected, entity counts fixed. Entity counts default to the
+        difficulty's per-level counts times the number of chunks.
+        """
+        chunk_w, chunk_h = self.width, self.height
+        cols = max(1, -(-(width - 1) // (chunk_w - 1)))
+        rows = max(1, -(-(height - 1) // (chunk_h - 1)))
+        
+        settings, chunk_treasures, chunk_monsters = self._get_settings(difficulty)
+        if num_treasures is None:
+            num_treasures = chunk_treasures * cols * rows
+        if num_monsters is None:
+            num_monsters = chunk_monsters * cols * rows
+        
+        # Every chunk uses the same prompt, so generate them in full batches
+        prompt = self._build_prompt(difficulty, settings, chunk_treasures, chunk_monsters)
+        raws = []
+        while len(raws) < cols * rows:
+            n = min(BATCH_SIZE, cols * rows - len(raws))
+            raws.extend(self.llm.generate_batch([prompt], n)[0])
+        
+        # Chunks overlap by one tile, their shared border becomes the seam
+        full_w = cols * (chunk_w - 1) + 1
+        full_h = rows * (chunk_h - 1) + 1
+        level = Level(['#' * full_w] * full_h)
+        
+        for k, raw in enumerate(raws):
+            r, c = divmod(k, cols)
+            chunk = self._parse(raw)
+            if chunk.walkable_count() == 0:
+                chunk = Level(self._create_fallback_level(difficulty, 0, 0))
+            
+            top, left = r * (chunk_h - 1), c * (chunk_w - 1)
+            for i in range(1, chunk_h - 1):
+                for j in range(1, chunk_w - 1):
+                    tile = chunk.get(i, j)
+                    # Player and exit are placed once for the whole map
+                    level.set(top + i, left + j, '.' if tile in ('P', 'E') else tile)
+        
+        # Open a door in every seam between neighbouring chunks
+        for r in range(rows):
+            for c in range(cols):
+                top, left = r * (chunk_h - 1), c * (chunk_w - 1)
+                if c + 1 < cols:
+                    seam = [(top + i, left + chunk_w - 1) for i in range(1, chunk_h - 1)]
+                    self._open_door(level, seam, (0, 1))
+                if r + 1 < rows:
+                    seam = [(top + chunk_h - 1, left + j) for j in range(1, chunk_w - 1)]
+                    self._open_door(level, seam, (1, 0))
+        
+        # Crop to the requested size, _fix_level redraws the border
+        if full_w != width or full_h != height:
+            level = Level([row[:width] for row in level.to_rows()[:height]])
+        
+        self._fix_level(level)
+        self._fix_entity_counts(level, num_treasures, num_monsters)
+        
+        return level.to_rows()
+    
+    def _open_door(self, level, seam, axis):
+        """Open one tile in a seam wall, preferring a spot with floor on both sides near the middle."""
+        di, dj = axis
+        middle = len(seam) // 2
+        
+        candidates = [k for k, (i, j) in enumerate(seam)
+                      if level.is_walkable(i - di, j - dj) and level.is_walkable(i + di, j + dj)]
+        if candidates:
+            k = min(candidates, key=lambda k: abs(k - middle))
+            i, j = seam[k]
+            level.set(i, j, '.')
+            return
+        
+        # No natural spot, open the middle and the tiles on both sides
+        i, j = seam[middle]
+        for step in (-1, 0, 1):
+            level.set(i + step * di, j + step * dj, '.')
+    
+    def _get_settings(self, difficulty, num_treasures=None, num_monsters=None):
+        """Look up difficulty settings and fill in default entity counts."""
+        settings = self.DIFFICULTY_SETTINGS.get(difficulty, self.DIFFICULTY_SETTINGS["medium"])
+        if num_treasures is None:
+            num_treasures = settings["treasures"]
+        if num_monsters is None:
+            num_monsters = settings["monsters"]
+        return settings, num_treasures, num_monsters
+    
+    def _build_prompt(self, difficulty, settings, num_treasures, num_monsters):
+        """Fill in the prompt template for a difficulty."""
+        return PROMPT_TEMPLATE.format(
+            difficulty=difficulty,
+            width=self.width,
+            height=self.height,
+            num_treasures=num_treasures,
+            num_monsters=num_monsters,
+            difficulty_description=settings["description"]
+        )
+    
+    def _process(self, raw, num_treasures, num_monsters):
+        """Turn raw LLM output into a cleaned level. Returns (level, playable)."""
+        # Parse and clean the output, all stages edit the same Level in place
+        with stage("parse"):
+            level = self._parse(raw)
+        with stage("fix_level"):
+            regions = self._fix_level(level)
+        
+        # Fix treasure and monster counts
+        with stage("fix_entity_counts"):
+            self._fix_entity_counts(level, num_treasures, num_monsters)
+        
+        # Check if playable, entity changes don't move walls so the regions still hold
+        with stage("validate"):
+            playable, _ = regions.is_playable()
+        
+        increment("outputs_total", result="playable" if playable else "unplayable")
+        return level.to_rows(), playable
+    
     def _parse(self, raw):
-        """Extract valid level characters from LLM output."""
+        """Extract valid level characters from LLM output. Returns a Level."""
         lines = []
         for line in raw.strip().split('\n'):
             clean = ''.join(c for c in line if c in TILES)
@@ -86,36 +340,41 @@ class LevelGenerator:
                 line = line + '#' * (self.width - len(line))
             result.append(line[:self.width])
         
-        return result
+        return Level(result)
     
     def _fix_level(self, level):
-        """Ensure level has exactly one player, one exit, connected floors, and walls around border."""
-        grid = [list(row) for row in level]
+        """
+        Ensure level has exactly one player, one exit, connected floors, and walls around border.
+        
+        Returns the level's RegionMap. It is built once, right after the
+        border walls, and every tile carved afterwards updates it, so
+        the stages after this one can check playability without a BFS.
+        """
+        height = level.height
+        width = level.width
         
         # Ensure border walls first
-        for i in range(len(grid)):
-            grid[i][0] = '#'
-            grid[i][-1] = '#'
-        for j in range(len(grid[0])):
-            grid[0][j] = '#'
-            grid[-1][j] = '#'
+        for i in range(height):
+            level.set(i, 0, '#')
+            level.set(i, width - 1, '#')
+        for j in range(width):
+            level.set(0, j, '#')
+            level.set(height - 1, j, '#')
+        
+        # Only floor is added from here on, which the region map tracks
+        regions = RegionMap(level)
         
         # Find all P and E positions
-        player_positions = []
-        exit_positions = []
-        for i in range(len(grid)):
-            for j in range(len(grid[0])):
-                if grid[i][j] == 'P':
-                    player_positions.append((i, j))
-                elif grid[i][j] == 'E':
-                    exit_positions.append((i, j))
+        player_positions = level.positions('P')
+        exit_positions = level.positions('E')
         
         # Keep only one P (prefer top-left area) and convert others to floor
         if len(player_positions) > 1:
             # Sort by distance from top-left
             player_positions.sort(key=lambda p: p[0] + p[1])
             for pi, pj in player_positions[1:]:
-                grid[pi][pj] = '.'
+                level.set(pi, pj, '.')
+            increment("repair_actions_total", len(player_positions) - 1, action="extra_player_removed")
             player_positions = [player_positions[0]]
         
         # Keep only one E (prefer bottom-right area) and convert others to floor
@@ -123,85 +382,61 @@ class LevelGenerator:
             # Sort by distance from bottom-right (descending)
             exit_positions.sort(key=lambda p: p[0] + p[1], reverse=True)
             for ei, ej in exit_positions[1:]:
-                grid[ei][ej] = '.'
+                level.set(ei, ej, '.')
+            increment("repair_actions_total", len(exit_positions) - 1, action="extra_exit_removed")
             exit_positions = [exit_positions[0]]
         
-        # Add player if missing (top-left area)
+        # Add player if missing (first floor tile, top-left area)
         if not player_positions:
-            for i in range(1, len(grid)-1):
-                for j in range(1, len(grid[0])-1):
-                    if grid[i][j] == '.':
-                        grid[i][j] = 'P'
-                        player_positions = [(i, j)]
-                        break
-                else:
-                    continue
-                break
+            floors = level.positions('.')
+            if floors:
+                level.set(floors[0][0], floors[0][1], 'P')
+                increment("repair_actions_total", action="player_added")
         
-        # Add exit if missing (bottom-right area)
+        # Add exit if missing (last floor tile, bottom-right area)
         if not exit_positions:
-            for i in range(len(grid)-2, 0, -1):
-                for j in range(len(grid[0])-2, 0, -1):
-                    if grid[i][j] == '.':
-                        grid[i][j] = 'E'
-                        exit_positions = [(i, j)]
-                        break
-                else:
-                    continue
-                break
+            floors = level.positions('.')
+            if floors:
+                level.set(floors[-1][0], floors[-1][1], 'E')
+                increment("repair_actions_total", action="exit_added")
         
         # Connect all floor regions to ensure playability
-        grid = self._connect_all_floors(grid)
+        with stage("connect_floors"):
+            self._connect_all_floors(level, regions)
         
         # Final check - carve path from P to E if still not connected
-        level = [''.join(row) for row in grid]
-        validator = LevelValidator(level)
-        playable, _ = validator.is_playable()
+        playable, _ = regions.is_playable()
         
         if not playable:
-            grid = [list(row) for row in level]
-            grid = self._carve_path(grid)
+            self._carve_path(level, regions)
+            increment("repair_actions_total", action="path_carved")
         
-        return [''.join(row) for row in grid]
+        return regions
     
     def _fix_entity_counts(self, level, target_treasures, target_monsters):
         """Ensure level has the correct number of treasures and monsters."""
         import random
         
-        grid = [list(row) for row in level]
-        height = len(grid)
-        width = len(grid[0])
+        # Current positions, straight from the level's index
+        treasures = level.positions('T')
+        monsters = level.positions('M')
+        floors = level.positions('.')
+        player_pos = level.find('P')
+        exit_pos = level.find('E')
         
-        # Find current positions
-        treasures = []
-        monsters = []
-        floors = []
-        player_pos = None
-        exit_pos = None
-        
-        for i in range(height):
-            for j in range(width):
-                if grid[i][j] == 'T':
-                    treasures.append((i, j))
-                elif grid[i][j] == 'M':
-                    monsters.append((i, j))
-                elif grid[i][j] == '.':
-                    floors.append((i, j))
-                elif grid[i][j] == 'P':
-                    player_pos = (i, j)
-                elif grid[i][j] == 'E':
-                    exit_pos = (i, j)
+        increment("repair_actions_total", max(0, len(treasures) - target_treasures), action="treasure_removed")
+        increment("repair_actions_total", max(0, len(monsters) - target_monsters), action="monster_removed")
         
         # Remove excess treasures
         while len(treasures) > target_treasures:
             ti, tj = treasures.pop()
-            grid[ti][tj] = '.'
+            level.set(ti, tj, '.')
             floors.append((ti, tj))
         
         # Remove excess monsters
         while len(monsters) > target_monsters:
             mi, mj = monsters.pop()
-            grid[mi][mj] = '.'
+            level.set(mi, mj, '.')
             floors.append((mi, mj))
         
         # Filter floors to avoid placing near P or E
@@ -214,131 +449,112 @@ class LevelGenerator:
         
         random.shuffle(safe_floors)
         
+        placed = len(safe_floors)
+        
         # Add missing treasures
         while len(treasures) < target_treasures and safe_floors:
             ti, tj = safe_floors.pop()
-            grid[ti][tj] = 'T'
+            level.set(ti, tj, 'T')
             treasures.append((ti, tj))
         
         # Add missing monsters
         while len(monsters) < target_monsters and safe_floors:
             mi, mj = safe_floors.pop()
-            grid[mi][mj] = 'M'
+            level.set(mi, mj, 'M')
             monsters.append((mi, mj))
         
-        return [''.join(row) for row in grid]
+        increment("repair_actions_total", placed - len(safe_floors), action="entity_added")
+        return level
     
-    def _connect_all_floors(self, grid):
-        """Connect all separate floor regions into one connected area."""
-        height = len(grid)
-        width = len(grid[0])
-        
-        def get_walkable_neighbors(i, j):
-            neighbors = []
-            for di, dj in [(-1,0), (1,0), (0,-1), (0,1)]:
-                ni, nj = i + di, j + dj
-                if 0 < ni < height-1 and 0 < nj < width-1:
-                    if grid[ni][nj] != '#':
-                        neighbors.append((ni, nj))
-            return neighbors
-        
-        def flood_fill(start, visited):
-            """Find all tiles connected to start."""
-            region = set()
-            stack = [start]
-            while stack:
-                pos = stack.pop()
-                if pos in visited:
-                    continue
-                visited.add(pos)
-                region.add(pos)
-                i, j = pos
-                for di, dj in [(-1,0), (1,0), (0,-1), (0,1)]:
-                    ni, nj = i + di, j + dj
-                    if 0 < ni < height-1 and 0 < nj < width-1:
-                        if grid[ni][nj] != '#' and (ni, nj) not in visited:
-                            stack.append((ni, nj))
-            return region
-        
-        # Find all separate floor regions
-        visited = set()
-        regions = []
+    def _connect_all_floors(self, level, regions=None):
+        """
+        Connect all separate floor regions into one connected area.
+        
+        Regions come from the level's RegionMap. A BFS from every floor
+        tile at once grows each region out through the walls. Where the
+        fronts of two regions meet is the shortest tunnel between them,
+        and a minimum spanning tree over those tunnels (Kruskal, on the
+        same union-find) picks which ones to carve. Runs in about linear
+        time in the grid area, so it also copes with large maps.
+        """
+        height = level.height
+        width = level.width
+        walkable = level.walkable
+        size = height * width
+        if regions is None:
+            regions = RegionMap(level)
+        
+        def interior_neighbors(idx):
+            """Neighbours of a flat index that are inside the border."""
+            i, j = divmod(idx, width)
+            if i > 1:
+                yield idx - width
+            if i < height - 2:
+                yield idx + width
+            if j > 1:
+                yield idx - 1
+            if j < width - 2:
+                yield idx + 1
+        
+        # Label every interior floor tile with its region's root
+        region_of = [-1] * size
         for i in range(1, height-1):
-            for j in range(1, width-1):
-                if grid[i][j] != '#' and (i, j) not in visited:
-                    region = flood_fill((i, j), visited)
-                    regions.append(region)
-        
-        if len(regions) <= 1:
-            return grid  # Already connected or no floors
-        
-        # Find which region contains the player
-        player_region_idx = 0
-        for idx, region in enumerate(regions):
-            for i, j in region:
-                if grid[i][j] == 'P':
-                    player_region_idx = idx
-                    break
-        
-        # Connect all other regions to the player's region
-        main_region = regions[player_region_idx]
-        
-        for idx, region in enumerate(regions):
-            if idx == player_region_idx:
+            for idx in range(i * width + 1, (i + 1) * width - 1):
+                if walkable[idx]:
+                    region_of[idx] = regions.find(idx)
+        num_regions = len(set(region_of)) - (-1 in region_of)
+        
+        if num_regions <= 1:
+            return level  # Already connected or no floors
+        
+        # Grow all regions through the walls together; each wall tile
+        # remembers the closest region and the step it was reached from
+        owner = list(region_of)
+        dist = [0] * size
+        parent = [-1] * size
+        queue = deque(idx for idx in range(size) if region_of[idx] >= 0)
+        
+        # Shortest tunnel found between each pair of regions
+        tunnels = {}
+        while queue:
+            idx = queue.popleft()
+            for n in interior_neighbors(idx):
+                if owner[n] < 0:
+                    owner[n] = owner[idx]
+                    dist[n] = dist[idx] + 1
+                    parent[n] = idx
+                    queue.append(n)
+                elif owner[n] != owner[idx]:
+                    pair = (min(owner[idx], owner[n]), max(owner[idx], owner[n]))
+                    length = dist[idx] + dist[n] + 1
+                    if pair not in tunnels or length < tunnels[pair][0]:
+                        tunnels[pair] = (length, idx, n)
+        
+        # Carve the shortest tunnels that join regions not yet connected;
+        # carving merges them in the region map
+        for _, a, b in sorted(tunnels.values()):
+            if regions.find(owner[a]) == regions.find(owner[b]):
                 continue
+            increment("repair_actions_total", action="tunnel_carved")
             
-            # Find closest points between main_region and this region
-            min_dist = float('inf')
-            best_main = None
-            best_other = None
-            
-            for mi, mj in main_region:
-                for oi, oj in region:
-                    dist = abs(mi - oi) + abs(mj - oj)
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_main = (mi, mj)
-                        best_other = (oi, oj)
-            
-            # Carve a path between them
-            if best_main and best_other:
-                mi, mj = best_main
-                oi, oj = best_other
-                
-                # Move horizontally first
-                j = mj
-                while j != oj:
-                    if grid[mi][j] == '#':
-                        grid[mi][j] = '.'
-                    j += 1 if oj > mj else -1
-                
-                # Then move vertically
-                i = mi
-                while i != oi:
-                    if grid[i][oj] == '#':
-                        grid[i][oj] = '.'
-                    i += 1 if oi > mi else -1
-                
-                # Add all tiles from this region to main_region
-                main_region = main_region.union(region)
+            # Walk back from both meeting tiles to their regions
+            for idx in (a, b):
+                while idx >= 0:
+                    if level.tiles[idx] == WALL:
+                        regions.carve(idx // width, idx % width)
+                    idx = parent[idx]
         
-        return grid
+        return level
     
-    def _carve_path(self, grid):
-        """Carve a path from player to exit to ensure playability."""
+    def _carve_path(self, level, regions=None):
+        """Carve a path from player to exit to ensure playability, updating regions if given."""
+        carve = regions.carve if regions is not None else level.set
         # Find player and exit positions
-        player_pos = None
-        exit_pos = None
-        
-        for i in range(len(grid)):
-            for j in range(len(grid[0])):
-                if grid[i][j] == 'P':
-                    player_pos = (i, j)
-                elif grid[i][j] == 'E':
-                    exit_pos = (i, j)
+        player_pos = level.find('P')
+        exit_pos = level.find('E')
         
         if not player_pos or not exit_pos:
-            return grid
+            return level
         
         # Carve horizontal then vertical path
         pi, pj = player_pos
@@ -347,25 +563,35 @@ class LevelGenerator:
         # Move horizontally first
         j = pj
         while j != ej:
-            if grid[pi][j] == '#':
-                grid[pi][j] = '.'
+            if level.get(pi, j) == '#':
+                carve(pi, j, '.')
             j += 1 if ej > pj else -1
         
         # Then move vertically
         i = pi
         while i != ei:
-            if grid[i][ej] == '#':
-                grid[i][ej] = '.'
+            if level.get(i, ej) == '#':
+                carve(i, ej, '.')
             i += 1 if ei > pi else -1
         
         # Make sure player and exit are still there
-        grid[player_pos[0]][player_pos[1]] = 'P'
-        grid[exit_pos[0]][exit_pos[1]] = 'E'
+        level.set(player_pos[0], player_pos[1], 'P')
+        level.set(exit_pos[0], exit_pos[1], 'E')
         
-        return grid
+        return level
+    
+    def _procedural(self):
+        """The procedural backend, created on first use since it needs NumPy."""
+        if self.procedural is None:
+            from procedural import ProceduralGenerator
+            self.procedural = ProceduralGenerator(self.width, self.height)
+        return self.procedural
     
     def _create_fallback_level(self, difficulty, num_treasures, num_monsters):
         """Create a guaranteed playable level if LLM fails."""
+        if FALLBACK_BACKEND == "procedural":
+            return self._procedural().generate(difficulty, num_treasures, num_monsters)
+        
         import random
         
         # Start with all walls
@@ -0,0 +1,185 @@
+# Level Pool - serves pre-generated levels and refills them in the background
+
+import json
+import os
+import threading
+from collections import deque
+
+from config import POOL_HIGH_WATER, POOL_PATH, BATCH_SIZE
+
+# Wait after a failed refill, doubled on every failure in a row up to the maximum
+RETRY_SECONDS = 1.0
+MAX_RETRY_SECONDS = 60.0
+
+
+class LevelPool:
+    """
+    Keeps a queue of ready, validated levels for each difficulty.
+    
+    get() pops a level in O(1). A background worker tops the queues
+    back up to the high-water mark with batched generate_many calls,
+    one batch covering every difficulty that is short, so callers
+    don't wait on the model. A get() on an empty queue waits for the
+    batch already being generated for its difficulty, or else
+    generates its level on the spot, ahead of any further refills.
+    The queues are saved to disk after each refill and loaded again
+    on the next run.
+    """
+    
+    def __init__(self, generator, difficulties=("easy", "medium", "hard"), high_water=POOL_HIGH_WATER, path=POOL_PATH):
+        self.generator = generator
+        self.high_water = high_water
+        self.path = path
+        self.queues = {diff: deque() for diff in difficulties}
+        
+        self.lock = threading.Lock()
+        # Signalled when a refill lands or an on-demand generation finishes
+        self.changed = threading.Condition(self.lock)
+        # The generator (and its model) is used by one thread at a time
+        self.generator_lock = threading.Lock()
+        # Difficulties in the worker's current batch, and callers generating on the spot
+        self.refilling = set()
+        self.on_demand = 0
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.worker = None
+        
+        self.load()
+    
+    def start(self):
+        """Start the background refill worker."""
+        if self.worker is None or not self.worker.is_alive():
+            self.stopping.clear()
+            self.worker = threading.Thread(target=self._refill_loop, daemon=True)
+            self.worker.start()
+        self.wake.set()
+    
+    def stop(self):
+        """Stop the refill worker and save the pool."""
+        self.stopping.set()
+        self.wake.set()
+        with self.lock:
+            self.changed.notify_all()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        self.save()
+    
+    def get(self, difficulty="medium"):
+        """Take a level from the pool, generating one on the spot if it is empty and no refill is coming."""
+        with self.lock:
+            queue = self.queues.get(difficulty)
+            # A batch with this difficulty is already being generated, wait for it
+            while queue is not None and not queue and difficulty in self.refilling:
+                self.changed.wait()
+            level = queue.popleft() if queue else None
+            if level is None:
+                self.on_demand += 1
+        
+        # Let the worker know a queue went down
+        self.wake.set()
+        
+        if level is None:
+            level = self._generate_now(lambda: self.generator.generate_speculative(difficulty=difficulty))
+        return level
+    
+    def get_many(self, difficulty="medium", count=1):
+        """Take count levels, generating whatever the pool can't cover in one batch."""
+        with self.lock:
+            queue = self.queues.get(difficulty, deque())
+            while len(queue) < count and difficulty in self.refilling:
+                self.changed.wait()
+            levels = [queue.popleft() for _ in range(min(count, len(queue)))]
+            missing = count - len(levels)
+            if missing:
+                self.on_demand += 1
+        self.wake.set()
+        
+        if missing:
+            levels.extend(self._generate_now(lambda: self.generator.generate_many([difficulty], missing)))
+        return levels
+    
+    def size(self, difficulty=None):
+        """Number of ready levels for one difficulty, or in total."""
+        with self.lock:
+            if difficulty is not None:
+                return len(self.queues.get(difficulty, ()))
+            return sum(len(queue) for queue in self.queues.values())
+    
+    def _generate_now(self, generate):
+        """Run a caller's generation (already counted in on_demand) before the worker's next batch."""
+        try:
+            with self.generator_lock:
+                return generate()
+        finally:
+            with self.lock:
+                self.on_demand -= 1
+                self.changed.notify_all()
+    
+    def _refill_loop(self):
+        """Worker: refill every queue below the high-water mark in one batch, sleep when all are full."""
+        retry = RETRY_SECONDS
+        while not self.stopping.is_set():
+            with self.lock:
+                # Callers generating on the spot go first
+                while self.on_demand and not self.stopping.is_set():
+                    self.changed.wait()
+                short = {diff: self.high_water - len(queue) for diff, queue in self.queues.items()
+                         if len(queue) < self.high_water}
+                self.refilling = set(short)
+            
+            if self.stopping.is_set():
+                break
+            if not short:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            
+            # Share the batch, but never more than a difficulty is short by
+            share = max(1, BATCH_SIZE // len(short))
+            difficulties = [diff for diff, missing in short.items() for _ in range(min(missing, share))]
+            try:
+                with self.generator_lock:
+                    levels = self.generator.generate_many(difficulties, 1)
+                with self.lock:
+                    for diff, level in zip(difficulties, levels):
+                        self.queues[diff].append(level)
+            except Exception as e:
+                # Keep the worker alive; get() generates on the spot meanwhile
+                print(f"  Pool refill failed ({type(e).__name__}: {e}), retrying in {retry:g}s")
+                self.stopping.wait(retry)
+                retry = min(retry * 2, MAX_RETRY_SECONDS)
+                continue
+            finally:
+                with self.lock:
+                    self.refilling = set()
+                    self.changed.notify_all()
+            retry = RETRY_SECONDS
+            self.save()
+    
+    def save(self):
+        """Write all queues to disk (atomically, via a temp file)."""
+        if not self.path:
+            return
+        with self.lock:
+            data = {diff: list(queue) for diff, queue in self.queues.items()}
+        
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+    
+    def load(self):
+        """Load queues saved by a previous run, if any."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        
+        with self.lock:
+            for diff, levels in data.items():
+                if diff in self.queues:
+                    self.queues[diff].extend(levels[:self.high_water])
@@ -0,0 +1,250 @@
+# Level Service - local HTTP/JSON server that batches level requests
+
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from level_generator import LevelGenerator
+from instrumentation import MetricsCollector, observe, increment
+from config import BATCH_SIZE, SERVICE_HOST, SERVICE_PORT, SERVICE_MAX_WAIT_MS, SERVICE_DEGRADE_QUEUE
+
+MAX_ATTEMPTS = 5
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class LevelRequest:
+    """One queued level request and the future its caller is waiting on."""
+    
+    def __init__(self, difficulty, num_treasures, num_monsters, prompt, future):
+        self.difficulty = difficulty
+        self.num_treasures = num_treasures
+        self.num_monsters = num_monsters
+        self.prompt = prompt
+        self.future = future
+        self.attempts = 0
+
+
+class LevelService:
+    """
+    Serves levels to many clients from one model.
+    
+    Requests go into a queue. The batch loop takes the first waiting
+    request, collects whatever else arrives within the max-wait window
+    (up to BATCH_SIZE), and decodes them all in one generate_batch
+    call. The model runs in its own thread and repair/validation in a
+    thread pool, so the event loop keeps accepting requests meanwhile.
+    Unplayable outputs go back into the queue until a request has used
+    its 5 attempts, then it gets a guaranteed playable level. Requests
+    for the procedural backend, and all requests while the queue is
+    over the degrade limit, skip the model and get a procedural level.
+    """
+    
+    def __init__(self, generator=None, max_wait_ms=SERVICE_MAX_WAIT_MS, batch_size=BATCH_SIZE,
+                 degrade_queue=SERVICE_DEGRADE_QUEUE):
+        self.generator = generator or LevelGenerator()
+        self.max_wait = max_wait_ms / 1000
+        self.batch_size = batch_size
+        self.degrade_queue = degrade_queue
+        self.queue = None
+        # The model is used by one thread at a time
+        self.llm_executor = ThreadPoolExecutor(max_workers=1)
+        self.repair_executor = ThreadPoolExecutor()
+        self.metrics = MetricsCollector()
+    
+    async def request(self, difficulty="medium", num_treasures=None, num_monsters=None, backend="llm"):
+        """Queue a level request and wait for the level. Returns a result dict."""
+        overloaded = self.degrade_queue is not None and self.queue.qsize() >= self.degrade_queue
+        if backend == "procedural" or overloaded:
+            increment("service_requests_total", source="procedural")
+            level = await asyncio.get_running_loop().run_in_executor(
+                self.repair_executor, self.generator.generate, difficulty, num_treasures, num_monsters, "procedural")
+            return {"level": level, "playable": True, "attempts": 0, "fallback": False, "backend": "procedural"}
+        
+        settings, num_treasures, num_monsters = self.generator._get_settings(difficulty, num_treasures, num_monsters)
+        prompt = self.generator._build_prompt(difficulty, settings, num_treasures, num_monsters)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(LevelRequest(difficulty, num_treasures, num_monsters, prompt, future))
+        return await future
+    
+    async def _next_batch(self):
+        """Wait for a request, then gather more until the batch is full or the window closes."""
+        batch = [await self.queue.get()]
+        start = asyncio.get_running_loop().time()
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        observe("service_batch_wait_seconds", asyncio.get_running_loop().time() - start)
+        observe("service_batch_size", len(batch))
+        return batch
+    
+    async def _batch_loop(self):
+        """Decode queued requests batch by batch."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            
+            # One prompt repeated n times shares the engine's cached prefill
+            prompts = [req.prompt for req in batch]
+            try:
+                if len(set(prompts)) == 1:
+                    outputs = await loop.run_in_executor(
+                        self.llm_executor, self.generator.llm.generate_batch, prompts[:1], len(batch))
+                    raws = outputs[0]
+                else:
+                    outputs = await loop.run_in_executor(
+                        self.llm_executor, self.generator.llm.generate_batch, prompts, 1)
+                    raws = [out[0] for out in outputs]
+            except Exception as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+            
+            for req, raw in zip(batch, raws):
+                loop.create_task(self._finish(req, raw))
+    
+    async def _finish(self, req, raw):
+        """Repair and validate one output off the event loop, then answer or retry."""
+        loop = asyncio.get_running_loop()
+        req.attempts += 1
+        try:
+            level, playable = await loop.run_in_executor(
+                self.repair_executor, self.generator._process, raw, req.num_treasures, req.num_monsters)
+            
+            if not playable and req.attempts < MAX_ATTEMPTS:
+                await self.queue.put(req)
+                return
+            
+            fallback = not playable
+            if fallback:
+                level = await loop.run_in_executor(
+                    self.repair_executor, self.generator._create_fallback_level,
+                    req.difficulty, req.num_treasures, req.num_monsters)
+        except Exception as e:
+            # The caller gets the error instead of waiting forever
+            if not req.future.done():
+                req.future.set_exception(e)
+            return
+        
+        observe("service_attempts", req.attempts)
+        increment("service_requests_total", source="fallback" if fallback else "llm")
+        if not req.future.done():
+            req.future.set_result({"level": level, "playable": True, "attempts": req.attempts, "fallback": fallback,
+                                   "backend": "llm"})
+    
+    async def _handle(self, reader, writer):
+        """Answer HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                
+                try:
+                    status, payload = await self._route(method, path, body)
+                except Exception as e:
+                    # A failed generation still gets an answer, and the connection stays usable
+                    increment("service_errors_total")
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _route(self, method, path, body):
+        """Dispatch one request. Returns (status, JSON payload or plain text)."""
+        if path == "/health":
+            return 200, {"status": "ok", "queued": self.queue.qsize()}
+        if path == "/metrics":
+            return 200, self.metrics.to_prometheus()
+        if path == "/metrics.json":
+            return 200, self.metrics.to_json()
+        if path != "/generate":
+            return 404, {"error": f"unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        
+        try:
+            params = json.loads(body or b"{}")
+            difficulty = params.get("difficulty", "medium")
+            num_treasures = params.get("treasures")
+            num_monsters = params.get("monsters")
+            backend = params.get("backend", "llm")
+        except (ValueError, AttributeError):
+            return 400, {"error": "body must be a JSON object"}
+        if difficulty not in self.generator.DIFFICULTY_SETTINGS:
+            return 400, {"error": f"unknown difficulty {difficulty!r}"}
+        if backend not in ("llm", "procedural"):
+            return 400, {"error": "backend must be 'llm' or 'procedural'"}
+        for count in (num_treasures, num_monsters):
+            if count is not None and (not isinstance(count, int) or count < 0):
+                return 400, {"error": "treasures and monsters must be non-negative integers"}
+        
+        return 200, await self.request(difficulty, num_treasures, num_monsters, backend)
+    
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT, unix_path=None):
+        """Run the server on a TCP port, or on a Unix socket if unix_path is given."""
+        self.queue = asyncio.Queue()
+        # Collect the pipeline's metrics for /metrics while serving
+        self.metrics.install()
+        batcher = asyncio.create_task(self._batch_loop())
+        
+        if unix_path:
+            server = await asyncio.start_unix_server(self._handle, path=unix_path)
+            print(f"Serving levels on {unix_path}")
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            print(f"Serving levels on http://{host}:{port}")
+        
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.metrics.uninstall()
+
+
+if __name__ == "__main__":
+    # python level_service.py [port | unix socket path]
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    service = LevelService()
+    try:
+        if target is None:
+            asyncio.run(service.serve())
+        elif target.isdigit():
+            asyncio.run(service.serve(port=int(target)))
+        else:
+            asyncio.run(service.serve(unix_path=target))
+    except KeyboardInterrupt:
+        pass
@@ -1,37 +1,403 @@
 # LLM Engine - loads and runs the TinyLlama model
 
+import copy
+from collections import OrderedDict
+from threading import Thread
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from config import MODEL_NAME, DEVICE, MAX_TOKENS, TEMPERATURE
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, DynamicCache, LogitsProcessor, LogitsProcessorList,
+    StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+)
+from config import (
+    MODEL_NAME, DEVICE, MAX_TOKENS, TEMPERATURE, EARLY_STOP, PROMPT_CACHE_SIZE, CONSTRAINED_DECODING,
+    CPU_PRECISION, COMPILE_MODEL, INTRA_OP_THREADS, INTER_OP_THREADS, MIN_FP32_AGREEMENT,
+    PROMPT_TEMPLATE, LEVEL_WIDTH, LEVEL_HEIGHT, TILES
+)
+from instrumentation import timer, observe, increment, enabled as instrumentation_enabled
+from engine_base import Engine, NEWLINE_TOKENS, scan_rows, grid_finished
+
+# Fixed prompt used to compare faster CPU modes against fp32
+VALIDATION_PROMPT = PROMPT_TEMPLATE.format(
+    difficulty="medium",
+    width=LEVEL_WIDTH,
+    height=LEVEL_HEIGHT,
+    num_treasures=3,
+    num_monsters=4,
+    difficulty_description="balanced rooms and corridors, moderate challenge"
+)
+
+
+def resolve_device():
+    """Turn the DEVICE setting into "cuda" or "cpu"."""
+    if DEVICE == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return DEVICE
+
 
-class LLMEngine:
-    """Handles loading the model and generating text."""
+def cpu_supports_bf16():
+    """Check if the CPU has native bf16 matmul support (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class GridStoppingCriteria(StoppingCriteria):
+    """Stops decoding a sequence once a full grid has been emitted."""
     
-    def __init__(self):
-        print(f"Loading {MODEL_NAME} on {DEVICE}...")
+    def __init__(self, tokenizer, prompt_length):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        done = [grid_finished(text) for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def grid_token_table(tokenizer):
+    """Map every token id that spells only tile characters, or a newline, to its text."""
+    table = {}
+    pieces = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    for token_id, piece in enumerate(pieces):
+        if piece in NEWLINE_TOKENS:
+            table[token_id] = '\n'
+        elif piece and all(c in TILES for c in piece):
+            table[token_id] = piece
+    return table
+
+
+class GridLogitsProcessor(LogitsProcessor):
+    """
+    Masks the logits so only a well-formed grid can be generated.
+    
+    Only tile tokens and newlines are allowed, border cells must be '#',
+    a newline is forced after exactly LEVEL_WIDTH tiles and end of
+    sequence is forced after LEVEL_HEIGHT rows.
+    """
+    
+    def __init__(self, token_table, eos_token_id, prompt_length, width=LEVEL_WIDTH, height=LEVEL_HEIGHT):
+        self.token_table = token_table
+        self.eos_token_id = eos_token_id
+        self.prompt_length = prompt_length
+        self.width = width
+        self.height = height
         
-        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        # Position (row, col) of each sequence in the grid
+        self.states = []
+        self.seen = 0
+        self.masks = {}
+    
+    def _advance(self, state, token_id):
+        """Move a grid position forward over one generated token."""
+        row, col = state
+        for c in self.token_table.get(token_id, ''):
+            if c == '\n':
+                row, col = row + 1, 0
+            else:
+                col += 1
+        return row, col
+    
+    def _allowed(self, text, row, col):
+        """Check if a token's text can be written at a grid position."""
+        if text == '\n':
+            return col == self.width and row < self.height - 1
+        if col + len(text) > self.width:
+            return False
+        border_row = row == 0 or row == self.height - 1
+        for k, c in enumerate(text):
+            if (border_row or col + k in (0, self.width - 1)) and c != '#':
+                return False
+        return True
+    
+    def _mask(self, row, col, scores):
+        """Additive mask for a grid position: 0 for allowed tokens, -inf elsewhere."""
+        key = (row == 0, row == self.height - 1, col)
+        if key not in self.masks:
+            mask = torch.full((scores.shape[-1],), float('-inf'), dtype=scores.dtype, device=scores.device)
+            if row == self.height - 1 and col == self.width:
+                mask[self.eos_token_id] = 0
+            else:
+                allowed = [t for t, text in self.token_table.items() if t < scores.shape[-1] and self._allowed(text, row, col)]
+                mask[allowed] = 0
+            self.masks[key] = mask
+        return self.masks[key]
+    
+    def __call__(self, input_ids, scores):
+        generated = input_ids.shape[1] - self.prompt_length
+        
+        if generated == self.seen + 1 and len(self.states) == input_ids.shape[0]:
+            # One new token per sequence since the last call
+            self.states = [self._advance(state, t) for state, t in zip(self.states, input_ids[:, -1].tolist())]
+        else:
+            self.states = []
+            for ids in input_ids[:, self.prompt_length:].tolist():
+                state = (0, 0)
+                for t in ids:
+                    state = self._advance(state, t)
+                self.states.append(state)
+        self.seen = generated
+        
+        masks = torch.stack([self._mask(row, col, scores) for row, col in self.states])
+        return scores + masks
+
+
+class LLMEngine(Engine):
+    """Handles loading the model and generating text with PyTorch."""
+    
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self.device = resolve_device()
+        print(f"Loading {model_name} on {self.device}...")
+        
+        # Thread counts have to be set before torch runs any parallel work
+        if INTRA_OP_THREADS:
+            torch.set_num_threads(INTRA_OP_THREADS)
+        if INTER_OP_THREADS:
+            try:
+                torch.set_num_interop_threads(INTER_OP_THREADS)
+            except RuntimeError:
+                print("  Inter-op threads already fixed for this process, keeping them.")
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        
+        # Left padding so batched prompts all end at the same position
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        
+        self.model = self._load_model()
+        # The precision actually in use, taken from the weights and updated by the CPU modes
+        self.precision = self._weights_precision()
+        if self.device == "cpu":
+            self._apply_cpu_modes()
+        
+        # Tile/newline tokens for constrained decoding, built on first use
+        self.grid_tokens = None
+        
+        # Tokenized prompts and their prefilled KV caches, most recent last
+        self.prompt_cache = OrderedDict()
+        
+        print("Model loaded.")
+    
+    def _load_model(self):
+        """
+        Load the model weights for the configured device.
         
-        if DEVICE == "cuda":
-            self.model = AutoModelForCausalLM.from_pretrained(
-                MODEL_NAME,
+        low_cpu_mem_usage builds the model without a second, randomly
+        initialized copy of the weights, and safetensors checkpoints are
+        memory-mapped rather than read into a separate buffer.
+        """
+        if self.device == "cuda":
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_name,
                 torch_dtype=torch.float16,
-                device_map="auto"
+                device_map="auto",
+                low_cpu_mem_usage=True
             )
-            self.pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer)
         else:
-            self.model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
-            self.pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, device=-1)
+            # fp32 explicitly: checkpoints stored in bf16 would otherwise stay bf16
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_name,
+                torch_dtype=torch.float32,
+                low_cpu_mem_usage=True
+            )
+        return model.eval()
+    
+    def _weights_precision(self):
+        """Precision name of the model's floating point weights."""
+        dtype = next(p.dtype for p in self.model.parameters() if p.is_floating_point())
+        return {torch.float32: "fp32", torch.bfloat16: "bf16", torch.float16: "fp16"}.get(dtype, str(dtype))
+    
+    def _apply_cpu_modes(self):
+        """
+        Switch the model to the CPU inference modes chosen in config.
         
-        print("Model loaded.")
+        int8 quantizes the linear layers dynamically, bf16 casts the
+        weights when the CPU has native bf16 support, and COMPILE_MODEL
+        wraps the forward pass in torch.compile. The result is checked
+        against fp32 on a fixed prompt; if too few next-token
+        predictions agree, the fp32 model is loaded again.
+        """
+        precision = CPU_PRECISION
+        if precision == "bf16" and not cpu_supports_bf16():
+            print("  CPU has no native bf16 support, staying in fp32.")
+            precision = "fp32"
+        if precision == "fp32" and not COMPILE_MODEL:
+            return
+        
+        reference = self._predictions()
+        
+        if precision == "int8":
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif precision == "bf16":
+            self.model = self.model.to(torch.bfloat16)
+        if COMPILE_MODEL:
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
+        
+        agreement = (self._predictions() == reference).float().mean().item()
+        mode = precision + (" + compile" if COMPILE_MODEL else "")
+        print(f"  {mode}: {agreement:.1%} of next-token predictions match fp32.")
+        
+        if agreement < MIN_FP32_AGREEMENT:
+            print(f"  Below {MIN_FP32_AGREEMENT:.0%}, falling back to fp32.")
+            self.model = self._load_model()
+            self.precision = self._weights_precision()
+        else:
+            self.precision = precision
+    
+    def _predictions(self):
+        """Greedy next-token predictions over a fixed prompt and sample grid."""
+        text = VALIDATION_PROMPT + '\n'.join(['#' * LEVEL_WIDTH] + ['#P' + '.' * (LEVEL_WIDTH - 4) + 'E#'] * 3)
+        inputs = self.tokenizer(text, return_tensors="pt").to(self.model.device)
+        with torch.no_grad():
+            return self.model(**inputs).logits.argmax(dim=-1)
+    
+    def sampling_params(self):
+        """Settings that change what the model outputs, part of the output cache key."""
+        return {
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+            "early_stop": EARLY_STOP,
+            "constrained": CONSTRAINED_DECODING,
+            "precision": self.precision,
+        }
+    
+    def generate_batch(self, prompts, n_per_prompt=1, seed=None):
+        """
+        Generate several completions for several prompts in one decode.
+        
+        Prompts are padded together and num_return_sequences samples
+        n_per_prompt outputs for each, so the model decodes the whole
+        batch at once instead of one sequence at a time. A seed makes
+        the sampling repeatable.
+        Returns one list of n_per_prompt strings per prompt.
+        """
+        if seed is not None:
+            torch.manual_seed(seed)
+        with timer("llm_generate_seconds"):
+            if len(prompts) == 1:
+                inputs, past_key_values = self._prefill(prompts[0], n_per_prompt)
+            else:
+                inputs, past_key_values = self._encode(prompts), None
+            output_ids = self._generate_ids(inputs, n_per_prompt, past_key_values=past_key_values)
+        
+        # Drop the (left-padded) prompt tokens, keep only the new ones
+        new_tokens = output_ids[:, inputs["input_ids"].shape[1]:]
+        texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        
+        if instrumentation_enabled():
+            observe("llm_batch_sequences", len(texts))
+            observe("llm_prompt_tokens", int(inputs["attention_mask"].sum()))
+            observe("llm_new_tokens", int((new_tokens != self.tokenizer.pad_token_id).sum()))
+        
+        return [texts[i * n_per_prompt:(i + 1) * n_per_prompt] for i in range(len(prompts))]
     
-    def generate(self, prompt):
-        """Generate text from a prompt."""
-        output = self.pipe(
-            prompt,
-            max_new_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE,
-            do_sample=True,
-            return_full_text=False
+    def generate_stream(self, prompt):
+        """
+        Yield level rows one at a time while the model is still generating.
+        
+        Decoding runs in a background thread and stops as soon as
+        LEVEL_HEIGHT rows are out or the model drifts into prose.
+        """
+        inputs, past_key_values = self._prefill(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        thread = Thread(
+            target=self._generate_ids,
+            args=(inputs, 1),
+            kwargs={"streamer": streamer, "early_stop": True, "past_key_values": past_key_values}
         )
-        return output[0]['generated_text']
+        thread.start()
+        
+        text = ""
+        emitted = 0
+        for chunk in streamer:
+            text += chunk
+            rows, drifted = scan_rows(text)
+            for row in rows[emitted:LEVEL_HEIGHT]:
+                yield row
+            emitted = len(rows)
+            if drifted or emitted >= LEVEL_HEIGHT:
+                break
+        
+        # The last row may have ended without a newline
+        if emitted < LEVEL_HEIGHT:
+            rows, _ = scan_rows(text + '\n')
+            for row in rows[emitted:LEVEL_HEIGHT]:
+                yield row
+        
+        thread.join()
+    
+    def _encode(self, prompts):
+        """Tokenize prompts into a left-padded batch on the model's device."""
+        return self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+    
+    def _prefill(self, prompt, n_per_prompt=1):
+        """
+        Get the encoded prompt and a KV cache already holding its prefill.
+        
+        The first time a prompt is seen it is tokenized and run through
+        the model once; retries and later requests with the same prompt
+        reuse that cache and go straight to sampling. The last prompt
+        token is left out of the cache so generate() has a token to feed.
+        Returns (inputs, past_key_values), with past_key_values None if
+        caching is disabled.
+        """
+        if PROMPT_CACHE_SIZE <= 0:
+            return self._encode([prompt]), None
+        
+        if prompt in self.prompt_cache:
+            self.prompt_cache.move_to_end(prompt)
+            increment("prompt_cache_total", result="hit")
+        else:
+            increment("prompt_cache_total", result="miss")
+            inputs = self._encode([prompt])
+            cache = DynamicCache()
+            with torch.no_grad(), timer("llm_prefill_seconds"):
+                self.model(
+                    input_ids=inputs["input_ids"][:, :-1],
+                    attention_mask=inputs["attention_mask"][:, :-1],
+                    past_key_values=cache,
+                    use_cache=True
+                )
+            self.prompt_cache[prompt] = (inputs, cache)
+            if len(self.prompt_cache) > PROMPT_CACHE_SIZE:
+                self.prompt_cache.popitem(last=False)
+        
+        inputs, cache = self.prompt_cache[prompt]
+        
+        # generate() extends the cache in place, so hand out a copy
+        past_key_values = copy.deepcopy(cache)
+        if n_per_prompt > 1:
+            past_key_values.batch_repeat_interleave(n_per_prompt)
+        return inputs, past_key_values
+    
+    def _generate_ids(self, inputs, n_per_prompt, streamer=None, early_stop=EARLY_STOP, past_key_values=None,
+                      constrained=CONSTRAINED_DECODING):
+        """Run sampling on an encoded batch. Returns prompt + generated token ids."""
+        prompt_length = inputs["input_ids"].shape[1]
+        
+        stopping = StoppingCriteriaList()
+        if early_stop:
+            stopping.append(GridStoppingCriteria(self.tokenizer, prompt_length))
+        
+        processors = LogitsProcessorList()
+        if constrained:
+            if self.grid_tokens is None:
+                self.grid_tokens = grid_token_table(self.tokenizer)
+            processors.append(GridLogitsProcessor(self.grid_tokens, self.tokenizer.eos_token_id, prompt_length))
+        
+        with torch.no_grad():
+            return self.model.generate(
+                **inputs,
+                max_new_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
+                do_sample=True,
+                num_return_sequences=n_per_prompt,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=stopping,
+                logits_processor=processors,
+                streamer=streamer,
+                past_key_values=past_key_values
+            )
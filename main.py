@@ -4,6 +4,8 @@
 
 from level_generator import LevelGenerator
 from evaluator import LevelEvaluator
+from level_pool import LevelPool
+from model_registry import preload, is_loaded
 
 # Example levels
 EXAMPLES = [
@@ -76,12 +78,12 @@ def generate_levels():
     generator = LevelGenerator()
     evaluator = LevelEvaluator()
     
-    levels = []
-    for diff in ["easy", "medium", "hard"]:
-        print(f"\nGenerating {diff} level...")
-        level = generator.generate(difficulty=diff)
-        levels.append(level)
-        
+    difficulties = ["easy", "medium", "hard"]
+    print(f"\nGenerating {', '.join(difficulties)} levels...")
+    levels = generator.generate_many(difficulties, count=1)
+    
+    for diff, level in zip(difficulties, levels):
+        print(f"\n{diff.capitalize()} level:")
         print_level(level)
         
         metrics = evaluator.evaluate(level)
@@ -108,6 +110,9 @@ def demo():
     print("Procedural Level Generator using LLM")
     print("="*50)
     
+    # Load the model while the examples are shown
+    preload()
+    
     input("\nPress Enter to see example levels...")
     show_examples()
     
@@ -125,9 +130,12 @@ def demo():
 
 def interactive():
     """Interactive mode."""
-    generator = None
+    pool = None
     evaluator = LevelEvaluator()
     
+    # Start loading the model now so it is warm by the time it is needed
+    preload()
+    
     while True:
         print("\n" + "="*40)
         print("LEVELCRAFTER-AI")
@@ -144,13 +152,15 @@ def interactive():
             show_examples()
         
         elif choice == "2":
-            if generator is None:
-                print("\nLoading model...")
-                generator = LevelGenerator()
+            if pool is None:
+                if not is_loaded():
+                    print("\nWaiting for the model to finish loading...")
+                pool = LevelPool(LevelGenerator())
+                pool.start()
             
             diff = input("Difficulty (easy/medium/hard) [medium]: ").strip() or "medium"
             print(f"\nGenerating {diff} level...")
-            level = generator.generate(difficulty=diff)
+            level = pool.get(diff)
             
             print_level(level)
             metrics = evaluator.evaluate(level)
@@ -158,18 +168,19 @@ def interactive():
             print(f"Score: {metrics['score']}")
         
         elif choice == "3":
-            if generator is None:
-                print("\nLoading model...")
-                generator = LevelGenerator()
+            if pool is None:
+                if not is_loaded():
+                    print("\nWaiting for the model to finish loading...")
+                pool = LevelPool(LevelGenerator())
+                pool.start()
             
             count = input("How many? [3]: ").strip()
             count = int(count) if count.isdigit() else 3
             
-            levels = []
-            for i in range(count):
-                print(f"\nGenerating level {i+1}/{count}...")
-                level = generator.generate()
-                levels.append(level)
+            print(f"\nGenerating {count} levels...")
+            levels = pool.get_many("medium", count)
+            for i, level in enumerate(levels):
+                print(f"\nLevel {i+1}/{count}:")
                 print_level(level)
             
             batch = evaluator.evaluate_batch(levels)
@@ -180,6 +191,8 @@ def interactive():
             demo()
         
         elif choice == "5":
+            if pool is not None:
+                pool.stop()
             print("Goodbye!")
             break
 
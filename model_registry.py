@@ -0,0 +1,70 @@
+# Model Registry - loads each model once per process and shares it
+
+import threading
+from concurrent.futures import Future
+
+from config import MODEL_NAME, ENGINE_BACKEND
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def _load(model_name, backend, future):
+    """Build the engine and hand it (or the error) to whoever is waiting."""
+    try:
+        # Imported here so nothing heavy is loaded until a model is needed
+        if backend == "onnx":
+            from onnx_engine import OnnxEngine
+            future.set_result(OnnxEngine(model_name))
+        elif backend == "torch":
+            from llm_engine import LLMEngine
+            future.set_result(LLMEngine(model_name))
+        else:
+            raise ValueError(f"unknown engine backend {backend!r}")
+    except BaseException as e:
+        # Forget the failed load so the next call tries again
+        with _lock:
+            if _engines.get((backend, model_name)) is future:
+                del _engines[(backend, model_name)]
+        future.set_exception(e)
+
+
+def _claim(model_name, backend):
+    """Get the future for a model. Returns (future, True) if the caller has to start the load."""
+    with _lock:
+        key = (backend, model_name)
+        if key in _engines:
+            return _engines[key], False
+        future = Future()
+        _engines[key] = future
+        return future, True
+
+
+def preload(model_name=MODEL_NAME, backend=ENGINE_BACKEND):
+    """Start loading a model in a background thread and return right away."""
+    future, start = _claim(model_name, backend)
+    if start:
+        threading.Thread(target=_load, args=(model_name, backend, future), daemon=True).start()
+
+
+def get_engine(model_name=MODEL_NAME, backend=ENGINE_BACKEND):
+    """
+    Return the shared engine for a model on a backend ("torch" or "onnx").
+    
+    Loads it on first use, or waits for a background preload that is
+    already running. Every generator gets the same engine, so the
+    weights are only in memory once. A load that fails raises for the
+    callers waiting on it and is then forgotten, so the next call
+    tries again.
+    """
+    future, start = _claim(model_name, backend)
+    if start:
+        _load(model_name, backend, future)
+    return future.result()
+
+
+def is_loaded(model_name=MODEL_NAME, backend=ENGINE_BACKEND):
+    """Check if a model has finished loading."""
+    with _lock:
+        future = _engines.get((backend, model_name))
+    return future is not None and future.done() and future.exception() is None
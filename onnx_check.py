@@ -0,0 +1,111 @@
+# ONNX Check - exports a tiny random Llama and checks OnnxEngine against PyTorch, offline
+
+import os
+import string
+import sys
+import tempfile
+
+# Logits may differ this much between ONNX Runtime and PyTorch
+MAX_LOGIT_DIFF = 1e-3
+# Greedy tokens compared per prompt
+GREEDY_TOKENS = 24
+
+PROMPTS = ["Make a level:\n", "A longer prompt for a hard level:\n"]
+
+
+def build_tiny_model(path):
+    """Save a randomly initialized 2-layer Llama and a character tokenizer to path."""
+    import torch
+    from tokenizers import Tokenizer, models, decoders
+    from transformers import PreTrainedTokenizerFast, LlamaConfig, LlamaForCausalLM
+    
+    # Printable characters, with byte tokens for newlines and anything else
+    vocab = {"<unk>": 0, "<s>": 1, "</s>": 2}
+    for b in range(256):
+        vocab[f"<0x{b:02X}>"] = len(vocab)
+    for c in string.printable.strip() + " ":
+        vocab.setdefault(c, len(vocab))
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[], byte_fallback=True, unk_token="<unk>"))
+    tokenizer.decoder = decoders.Sequence([decoders.ByteFallback(), decoders.Fuse()])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>",
+                                        unk_token="<unk>")
+    
+    # Large random weights, so outputs depend strongly on positions and the cache
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=len(vocab), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=1024,
+                         initializer_range=0.5, bos_token_id=1, eos_token_id=2, pad_token_id=2)
+    LlamaForCausalLM(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+
+def check_onnx(workdir):
+    """
+    Export the tiny model with OnnxEngine and compare it with PyTorch.
+    
+    Returns a list of failure messages (empty if everything matches):
+    first-step logits on a left-padded batch, greedy decoding through
+    the KV cache against model.generate, and seeded sampling.
+    """
+    import numpy as np
+    import torch
+    from transformers import AutoModelForCausalLM
+    from onnx_engine import OnnxEngine
+    
+    model_dir = os.path.join(workdir, "model")
+    build_tiny_model(model_dir)
+    engine = OnnxEngine(model_dir, path=os.path.join(workdir, "onnx", "model.onnx"))
+    model = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=torch.float32).eval()
+    failures = []
+    
+    # First-step logits, with the first prompt left-padded
+    encoded = engine.tokenizer(PROMPTS, return_tensors="np", padding=True)
+    attention_mask = encoded["attention_mask"].astype(np.int64)
+    feeds = {
+        "input_ids": encoded["input_ids"].astype(np.int64),
+        "attention_mask": attention_mask,
+        "position_ids": np.maximum(attention_mask.cumsum(axis=1) - 1, 0),
+    }
+    for name in engine.past_names:
+        feeds[name] = np.zeros((len(PROMPTS), engine.kv_heads, 0, engine.head_dim), dtype=np.float32)
+    onnx_logits = engine.session.run(["logits"], feeds)[0]
+    with torch.no_grad():
+        torch_logits = model(**{name: torch.from_numpy(value) for name, value in feeds.items()
+                                if not name.startswith("past.")}).logits[:, -1].numpy()
+    diff = float(np.abs(onnx_logits - torch_logits).max())
+    if diff > MAX_LOGIT_DIFF:
+        failures.append(f"logits differ from PyTorch by {diff:.2e}")
+    
+    # Greedy decoding through the cache
+    engine._sample = lambda logits, rng: logits.argmax(axis=1)
+    onnx_tokens = None
+    for step, onnx_tokens in enumerate(engine._decode(PROMPTS, None, False)):
+        if step + 1 >= GREEDY_TOKENS:
+            break
+    inputs = engine.tokenizer(PROMPTS, return_tensors="pt", padding=True)
+    with torch.no_grad():
+        output = model.generate(**inputs, do_sample=False, max_new_tokens=GREEDY_TOKENS,
+                                pad_token_id=engine.tokenizer.pad_token_id)
+    eos = engine.tokenizer.eos_token_id
+    for n, row in enumerate(output[:, inputs["input_ids"].shape[1]:].tolist()):
+        expected = row[:row.index(eos)] if eos in row else row
+        if onnx_tokens[n] != expected:
+            failures.append(f"greedy tokens for prompt {n} differ from model.generate")
+    del engine._sample
+    
+    # Seeded sampling repeats
+    if engine.generate_batch(PROMPTS, 2, seed=7) != engine.generate_batch(PROMPTS, 2, seed=7):
+        failures.append("the same seed gave different outputs")
+    
+    return failures
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as workdir:
+        failures = check_onnx(workdir)
+    
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    sys.exit(1 if failures else 0)
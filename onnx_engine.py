@@ -0,0 +1,258 @@
+# ONNX Engine - runs the model with ONNX Runtime instead of PyTorch
+
+import os
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+from engine_base import Engine, scan_rows, grid_finished
+from instrumentation import timer, observe, enabled as instrumentation_enabled
+from config import (
+    MODEL_NAME, MAX_TOKENS, TEMPERATURE, EARLY_STOP, CONSTRAINED_DECODING, INTRA_OP_THREADS, ONNX_DIR, LEVEL_HEIGHT
+)
+
+# Sampling keeps the k most likely tokens, like transformers' generate() default
+TOP_K = 50
+
+
+def onnx_path(model_name):
+    """Where the exported model for a model name or local path is kept."""
+    name = model_name.strip("/\\").replace("/", "--").replace("\\", "--")
+    return os.path.join(ONNX_DIR, name, "model.onnx")
+
+
+def export_onnx(model_name, path):
+    """
+    Export a causal LM to ONNX with its KV cache as inputs and outputs.
+    
+    The graph takes input_ids, attention_mask, position_ids and the
+    past keys/values of every layer (past.<layer>.key/value, length 0
+    on the first step) and returns the next-token logits and the
+    updated keys/values (present.<layer>.key/value). Batch, sequence
+    and cache lengths are all dynamic. Needs PyTorch, but only here.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, DynamicCache
+    
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32).eval()
+    config = model.config
+    layers = config.num_hidden_layers
+    heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+    
+    class Decoder(torch.nn.Module):
+        """The model with the cache flattened into plain tensors."""
+        
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+        
+        def forward(self, input_ids, attention_mask, position_ids, *past):
+            cache = DynamicCache()
+            for layer in range(layers):
+                cache.update(past[2 * layer], past[2 * layer + 1], layer)
+            out = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=cache, use_cache=True, logits_to_keep=1)
+            present = []
+            for layer in out.past_key_values.layers:
+                present += [layer.keys, layer.values]
+            return (out.logits[:, -1, :], *present)
+    
+    # Example inputs, the exported shapes are dynamic
+    batch, seq, past_len = 2, 5, 3
+    input_ids = torch.ones((batch, seq), dtype=torch.long)
+    attention_mask = torch.ones((batch, past_len + seq), dtype=torch.long)
+    position_ids = torch.arange(past_len, past_len + seq).expand(batch, seq)
+    past = [torch.zeros((batch, heads, past_len, head_dim)) for _ in range(2 * layers)]
+    
+    kv_names = [f"{layer}.{kind}" for layer in range(layers) for kind in ("key", "value")]
+    dims = {name: torch.export.Dim(name, min=0 if name == "past" else 1) for name in ("batch", "seq", "past", "total")}
+    dynamic_shapes = {
+        "input_ids": {0: dims["batch"], 1: dims["seq"]},
+        "attention_mask": {0: dims["batch"], 1: dims["total"]},
+        "position_ids": {0: dims["batch"], 1: dims["seq"]},
+        "past": tuple({0: dims["batch"], 2: dims["past"]} for _ in kv_names),
+    }
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.onnx.export(
+        Decoder(model),
+        (input_ids, attention_mask, position_ids, *past),
+        path,
+        input_names=["input_ids", "attention_mask", "position_ids"] + ["past." + n for n in kv_names],
+        output_names=["logits"] + ["present." + n for n in kv_names],
+        dynamic_shapes=dynamic_shapes,
+        dynamo=True
+    )
+
+
+class OnnxEngine(Engine):
+    """
+    Runs the model through ONNX Runtime's CPU execution provider.
+    
+    The model is exported to ONNX on first use and kept in ONNX_DIR.
+    Decoding is a plain loop: one prefill run over the prompts, then
+    one run per token with the KV cache fed back in. Inputs and outputs
+    go through IO binding, so the cache stays in ONNX Runtime's own
+    buffers between steps and only the next-token logits are copied
+    out. Sampling (temperature, top-k) and the early stop after a full
+    grid happen in NumPy. Constrained decoding is not supported here.
+    """
+    
+    def __init__(self, model_name=MODEL_NAME, path=None):
+        self.model_name = model_name
+        self.device = "cpu"
+        self.path = path or onnx_path(model_name)
+        print(f"Loading {model_name} with ONNX Runtime...")
+        
+        if not os.path.exists(self.path):
+            print(f"  Exporting to {self.path}...")
+            export_onnx(model_name, self.path)
+        if CONSTRAINED_DECODING:
+            print("  Constrained decoding is not available with ONNX Runtime, sampling freely.")
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if INTRA_OP_THREADS:
+            options.intra_op_num_threads = INTRA_OP_THREADS
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        self.past_names = [name for name in inputs if name.startswith("past.")]
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        # past.<layer>.<kind> is (batch, heads, length, head_dim)
+        shape = inputs[self.past_names[0]].shape
+        self.kv_heads, self.head_dim = shape[1], shape[3]
+        
+        print("Model loaded.")
+    
+    def sampling_params(self):
+        """Settings that change what the model outputs, part of the output cache key."""
+        return {
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+            "top_k": TOP_K,
+            "early_stop": EARLY_STOP,
+            "backend": "onnx",
+        }
+    
+    def generate_batch(self, prompts, n_per_prompt=1, seed=None):
+        """
+        Generate several completions for several prompts in one decode.
+        
+        Each prompt is repeated n_per_prompt times and all of them are
+        decoded together. Returns one list of n_per_prompt strings per
+        prompt.
+        """
+        expanded = [prompt for prompt in prompts for _ in range(n_per_prompt)]
+        rng = np.random.default_rng(seed)
+        
+        tokens = None
+        with timer("llm_generate_seconds"):
+            for tokens in self._decode(expanded, rng, EARLY_STOP):
+                pass
+        texts = self.tokenizer.batch_decode(tokens, skip_special_tokens=True)
+        
+        if instrumentation_enabled():
+            observe("llm_batch_sequences", len(texts))
+            observe("llm_new_tokens", sum(len(t) for t in tokens))
+        
+        return [texts[i * n_per_prompt:(i + 1) * n_per_prompt] for i in range(len(prompts))]
+    
+    def generate_stream(self, prompt):
+        """Yield level rows one at a time while the model is still generating."""
+        emitted = 0
+        text = ""
+        for tokens in self._decode([prompt], np.random.default_rng(), True):
+            text = self.tokenizer.decode(tokens[0], skip_special_tokens=True)
+            rows, drifted = scan_rows(text)
+            for row in rows[emitted:LEVEL_HEIGHT]:
+                yield row
+            emitted = len(rows)
+            if drifted or emitted >= LEVEL_HEIGHT:
+                return
+        
+        # The last row may have ended without a newline
+        rows, _ = scan_rows(text + '\n')
+        for row in rows[emitted:LEVEL_HEIGHT]:
+            yield row
+    
+    def _sample(self, logits, rng):
+        """Pick one token per row of logits with temperature and top-k sampling."""
+        k = min(TOP_K, logits.shape[1])
+        top = np.argpartition(-logits, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(logits, top, axis=1) / TEMPERATURE
+        probs = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        
+        picks = (probs.cumsum(axis=1) < rng.random((len(probs), 1))).sum(axis=1)
+        return top[np.arange(len(top)), np.minimum(picks, k - 1)]
+    
+    def _decode(self, prompts, rng, early_stop):
+        """
+        Sample up to MAX_TOKENS tokens for each prompt.
+        
+        Yields the generated token ids of every sequence after each
+        step; sequences that hit end of sequence, or a full grid with
+        early_stop, stop growing.
+        """
+        encoded = self.tokenizer(prompts, return_tensors="np", padding=True)
+        input_ids = encoded["input_ids"].astype(np.int64)
+        attention_mask = encoded["attention_mask"].astype(np.int64)
+        position_ids = np.maximum(attention_mask.cumsum(axis=1) - 1, 0)
+        batch = len(prompts)
+        observe("llm_prompt_tokens", int(attention_mask.sum()))
+        
+        eos = self.tokenizer.eos_token_id
+        generated = [[] for _ in range(batch)]
+        finished = np.zeros(batch, dtype=bool)
+        
+        # The cache starts empty and then only lives in OrtValues
+        empty = np.zeros((batch, self.kv_heads, 0, self.head_dim), dtype=np.float32)
+        past = [ort.OrtValue.ortvalue_from_numpy(empty) for _ in self.past_names]
+        binding = self.session.io_binding()
+        
+        for step in range(MAX_TOKENS):
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+            binding.bind_cpu_input("input_ids", input_ids)
+            binding.bind_cpu_input("attention_mask", attention_mask)
+            binding.bind_cpu_input("position_ids", position_ids)
+            for name, value in zip(self.past_names, past):
+                binding.bind_ortvalue_input(name, value)
+            for name in self.output_names:
+                binding.bind_output(name, "cpu")
+            
+            if step == 0:
+                with timer("llm_prefill_seconds"):
+                    self.session.run_with_iobinding(binding)
+            else:
+                self.session.run_with_iobinding(binding)
+            outputs = binding.get_outputs()
+            logits = outputs[0].numpy()
+            past = outputs[1:]
+            
+            next_tokens = self._sample(logits, rng)
+            next_tokens[finished] = self.tokenizer.pad_token_id
+            for b in np.nonzero(~finished)[0]:
+                token = int(next_tokens[b])
+                if token == eos:
+                    finished[b] = True
+                    continue
+                generated[b].append(token)
+                if early_stop and grid_finished(self.tokenizer.decode(generated[b], skip_special_tokens=True)):
+                    finished[b] = True
+            
+            yield generated
+            if finished.all():
+                return
+            
+            input_ids = next_tokens[:, None].astype(np.int64)
+            attention_mask = np.concatenate([attention_mask, np.ones((batch, 1), dtype=np.int64)], axis=1)
+            position_ids = position_ids[:, -1:] + 1
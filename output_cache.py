@@ -0,0 +1,189 @@
+# Output Cache - keeps raw LLM outputs on disk so runs can be replayed
+
+import hashlib
+import json
+import os
+
+from engine_base import Engine
+from config import MODEL_NAME, OUTPUT_CACHE_MAX_MB
+
+# Sampling settings the outputs were written with, per model, kept next to the entries
+PARAMS_FILE = "params.json"
+
+
+class OutputCache:
+    """
+    Content-addressed, size-bounded store of raw LLM outputs.
+    
+    Each output is one file named after the SHA-256 of its key (model,
+    prompt, sampling settings, seed, and the batch it was decoded in).
+    Reading an entry touches its modification time, and when the cache
+    grows past max_bytes the least recently used entries are deleted
+    first. The sampling settings of each model are also kept in
+    params.json, so the cache can be replayed without the model.
+    """
+    
+    def __init__(self, path, max_bytes=OUTPUT_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(os.path.getsize(file) for file in self._files())
+    
+    @staticmethod
+    def key(model, prompt, params, seed, batch=None):
+        """Hash identifying one output; batch describes the engine call it came from."""
+        data = json.dumps([model, prompt, params, seed, batch], sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+    
+    def load_params(self, model):
+        """Sampling settings outputs for a model were written with, one dict per set."""
+        try:
+            with open(os.path.join(self.path, PARAMS_FILE), encoding="utf-8") as f:
+                return json.load(f).get(model, [])
+        except (OSError, ValueError):
+            return []
+    
+    def save_params(self, model, params):
+        """Record the sampling settings a model's outputs are written with."""
+        known = self.load_params(model)
+        if params in known:
+            return
+        try:
+            with open(os.path.join(self.path, PARAMS_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[model] = known + [params]
+        
+        file = os.path.join(self.path, PARAMS_FILE)
+        with open(file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(file + ".tmp", file)
+    
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+    
+    def _files(self):
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                if not name.endswith(".tmp") and name != PARAMS_FILE:
+                    yield os.path.join(root, name)
+    
+    def get(self, key):
+        """Cached output for a key, or None."""
+        file = self._file(key)
+        try:
+            with open(file, encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        # Mark as recently used
+        os.utime(file)
+        return text
+    
+    def put(self, key, text):
+        """Store an output (atomically) and evict old entries if over the size limit."""
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        if os.path.exists(file):
+            self.size -= os.path.getsize(file)
+        
+        tmp_file = file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_file, file)
+        self.size += os.path.getsize(file)
+        
+        if self.size > self.max_bytes:
+            self.evict()
+    
+    def evict(self, target=None):
+        """Delete least recently used entries until the cache is under target bytes (90% of the limit)."""
+        if target is None:
+            target = self.max_bytes * 0.9
+        entries = []
+        for file in self._files():
+            stat = os.stat(file)
+            entries.append((stat.st_mtime, stat.st_size, file))
+        entries.sort()
+        
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, file in entries:
+            if self.size <= target:
+                break
+            os.remove(file)
+            self.size -= size
+    
+    def __len__(self):
+        return sum(1 for _ in self._files())
+
+
+class CachedEngine(Engine):
+    """
+    Wraps an engine with seeded generation and an OutputCache.
+    
+    Each generate_batch call is still one batched engine call, seeded
+    as a whole: the n-th call with the same prompts and n_per_prompt
+    gets seed seed + n. Since a sampled text depends on everything it
+    was decoded with, cache keys hold the whole batch, not just the
+    prompt. A rerun that batches its requests the same way gets every
+    output from the cache; one that batches differently misses and
+    decodes again, but never replays a text made for another batch.
+    With engine=None the cache is replayed without a model, using
+    params (or the settings stored in the cache, if there is just one
+    set for the model), and a miss raises KeyError. Streaming goes
+    through the cache as well; other attributes pass through to the
+    engine.
+    """
+    
+    def __init__(self, engine, cache=None, seed=0, model_name=None, params=None):
+        self.engine = engine
+        self.cache = cache
+        self.seed = seed
+        self.model_name = model_name or getattr(engine, "model_name", MODEL_NAME)
+        
+        if engine is not None:
+            self.params = engine.sampling_params() if hasattr(engine, "sampling_params") else {}
+            if cache is not None:
+                cache.save_params(self.model_name, self.params)
+        elif params is not None:
+            self.params = params
+        else:
+            stored = cache.load_params(self.model_name) if cache is not None else []
+            if len(stored) != 1:
+                raise ValueError(f"the cache holds {len(stored)} sets of sampling settings for "
+                                 f"{self.model_name}, pass params to pick one")
+            self.params = stored[0]
+        
+        # Calls made so far per batch of prompts, the next one's seed offset
+        self.drawn = {}
+    
+    def __getattr__(self, name):
+        engine = self.__dict__.get("engine")
+        if engine is None:
+            raise AttributeError(name)
+        return getattr(engine, name)
+    
+    def generate_batch(self, prompts, n_per_prompt=1, seed=None):
+        """Like LLMEngine.generate_batch, with the batch seeded and cached (seed is ignored)."""
+        batch = json.dumps([list(prompts), n_per_prompt])
+        draw = self.drawn.get(batch, 0)
+        self.drawn[batch] = draw + 1
+        seed = self.seed + draw
+        
+        keys = [[OutputCache.key(self.model_name, prompt, self.params, seed, [list(prompts), n_per_prompt, p, i])
+                 for i in range(n_per_prompt)] for p, prompt in enumerate(prompts)]
+        if self.cache is not None:
+            results = [[self.cache.get(key) for key in row] for row in keys]
+            if all(text is not None for row in results for text in row):
+                return results
+        
+        if self.engine is None:
+            raise KeyError(f"outputs for a batch of {len(prompts)} prompts are not in the cache")
+        
+        results = self.engine.generate_batch(prompts, n_per_prompt, seed=seed)
+        if self.cache is not None:
+            for row, texts in zip(keys, results):
+                for key, text in zip(row, texts):
+                    self.cache.put(key, text)
+        return results
@@ -0,0 +1,164 @@
+# Procedural Generator - fast non-LLM levels from vectorized drunkard's walks
+
+import numpy as np
+
+from level_generator import LevelGenerator
+from config import LEVEL_WIDTH, LEVEL_HEIGHT
+
+WALL = ord('#')
+FLOOR = ord('.')
+
+# Per difficulty: walker steps per interior tile, walkers per level, the
+# chance a walker keeps its direction (long straight corridors), and the
+# chance per step of opening a room (and its size)
+STYLE = {
+    "easy": {"steps": 0.5, "walkers": 3, "momentum": 0.5, "room_chance": 0.05, "room_size": 5},
+    "medium": {"steps": 0.6, "walkers": 4, "momentum": 0.6, "room_chance": 0.03, "room_size": 4},
+    "hard": {"steps": 0.7, "walkers": 5, "momentum": 0.75, "room_chance": 0.0, "room_size": 0},
+}
+
+
+class ProceduralGenerator:
+    """
+    Generates levels without the LLM, many at a time.
+    
+    Each level is dug out by a few drunkard's-walk walkers that start
+    together in the middle and carve corridors as wide as the
+    difficulty's corridor_width, sometimes opening a room. All levels
+    of a batch are walked at once as NumPy arrays. Walkers tend to keep
+    their direction, more so on hard, which gives long narrow corridors. Every carved step
+    overlaps the last one, so the floor is always one connected area:
+    P goes on the floor tile nearest the top-left corner, E on the one
+    nearest the bottom-right, and the treasures and monsters on random
+    floor tiles more than 2 steps from both, so every level is
+    playable without repair. Same interface as LevelGenerator.
+    """
+    
+    DIFFICULTY_SETTINGS = LevelGenerator.DIFFICULTY_SETTINGS
+    
+    def __init__(self, width=LEVEL_WIDTH, height=LEVEL_HEIGHT, seed=None):
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+    
+    def generate(self, difficulty="medium", num_treasures=None, num_monsters=None):
+        """Generate a single playable level."""
+        return self.generate_batch(1, difficulty, num_treasures, num_monsters)[0]
+    
+    def generate_many(self, difficulties, count=1, dedup=None):
+        """
+        Generate count levels for each difficulty, grouped in the order of difficulties.
+        
+        With a LevelDeduplicator as dedup, repeats are dropped and made
+        again, up to 5 rounds.
+        """
+        if isinstance(difficulties, str):
+            difficulties = [difficulties]
+        
+        levels = []
+        for diff in difficulties:
+            found = []
+            for _ in range(5):
+                batch = self.generate_batch(count - len(found), diff)
+                found.extend(level for level in batch if dedup is None or dedup.add(level))
+                if len(found) >= count:
+                    break
+            levels.extend(found[:count])
+        return levels
+    
+    def generate_batch(self, count, difficulty="medium", num_treasures=None, num_monsters=None):
+        """Generate count levels of one difficulty as lists of strings."""
+        tiles = self.generate_tiles(count, difficulty, num_treasures, num_monsters)
+        return [[row.tobytes().decode('ascii') for row in grid] for grid in tiles]
+    
+    def generate_tiles(self, count, difficulty="medium", num_treasures=None, num_monsters=None):
+        """Generate count levels as an (N, H, W) uint8 array, ready for BatchValidator or LevelArchive."""
+        settings = self.DIFFICULTY_SETTINGS.get(difficulty, self.DIFFICULTY_SETTINGS["medium"])
+        style = STYLE.get(difficulty, STYLE["medium"])
+        if num_treasures is None:
+            num_treasures = settings["treasures"]
+        if num_monsters is None:
+            num_monsters = settings["monsters"]
+        
+        tiles = np.full((count, self.height, self.width), WALL, dtype=np.uint8)
+        if count:
+            self._dig(tiles, settings["corridor_width"], style)
+            self._place_entities(tiles, num_treasures, num_monsters)
+        return tiles
+    
+    def _carve(self, tiles, levels, rows, cols, size):
+        """Carve a size x size square of floor at (rows, cols) in each of the given levels."""
+        rows = np.clip(rows, 1, max(1, self.height - 1 - size))
+        cols = np.clip(cols, 1, max(1, self.width - 1 - size))
+        for di in range(size):
+            for dj in range(size):
+                tiles[levels, np.minimum(rows + di, self.height - 2), np.minimum(cols + dj, self.width - 2)] = FLOOR
+    
+    def _dig(self, tiles, corridor_width, style):
+        """Run every walker of every level in lockstep, carving as they go."""
+        count = tiles.shape[0]
+        width = max(1, min(corridor_width, self.width - 2, self.height - 2))
+        walkers = style["walkers"]
+        
+        interior = (self.height - 2) * (self.width - 2)
+        steps = max(2, int(interior * style["steps"] / walkers))
+        
+        levels = np.repeat(np.arange(count), walkers)
+        rows = np.full(levels.size, (self.height - width) // 2)
+        cols = np.full(levels.size, (self.width - width) // 2)
+        max_row = max(1, self.height - 1 - width)
+        max_col = max(1, self.width - 1 - width)
+        moves = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+        direction = self.rng.integers(0, 4, levels.size)
+        
+        # Start with two tiles, so even the smallest level has room for P and E
+        self._carve(tiles, levels, rows, cols, width)
+        self._carve(tiles, levels, rows, cols + 1, width)
+        for _ in range(steps):
+            turns = self.rng.random(levels.size) >= style["momentum"]
+            direction[turns] = self.rng.integers(0, 4, int(turns.sum()))
+            step = moves[direction]
+            rows = np.clip(rows + step[:, 0], 1, max_row)
+            cols = np.clip(cols + step[:, 1], 1, max_col)
+            self._carve(tiles, levels, rows, cols, width)
+            
+            if style["room_chance"]:
+                opens = self.rng.random(levels.size) < style["room_chance"]
+                if opens.any():
+                    size = style["room_size"]
+                    self._carve(tiles, levels[opens], rows[opens] - size // 2, cols[opens] - size // 2, size)
+    
+    def _place_entities(self, tiles, num_treasures, num_monsters):
+        """Put P top-left, E bottom-right and the T/M on safe floor tiles, in every level at once."""
+        count = tiles.shape[0]
+        flat = tiles.reshape(count, -1)
+        ii, jj = np.divmod(np.arange(flat.shape[1]), self.width)
+        floor = flat == FLOOR
+        everyone = np.arange(count)
+        
+        corner = ii + jj
+        player = np.where(floor, corner, np.iinfo(np.int64).max).argmin(axis=1)
+        far = np.where(floor, corner, -1)
+        far[everyone, player] = -1
+        exit_tile = far.argmax(axis=1)
+        flat[everyone, player] = ord('P')
+        flat[everyone, exit_tile] = ord('E')
+        
+        # Same rule as LevelGenerator._fix_entity_counts: more than 2 steps from P and E
+        pi, pj = np.divmod(player, self.width)
+        ei, ej = np.divmod(exit_tile, self.width)
+        safe = (floor & (np.abs(ii - pi[:, None]) + np.abs(jj - pj[:, None]) > 2)
+                & (np.abs(ii - ei[:, None]) + np.abs(jj - ej[:, None]) > 2))
+        
+        wanted = num_treasures + num_monsters
+        if wanted == 0:
+            return
+        keys = self.rng.random(flat.shape)
+        keys[~safe] = 2.0
+        picks = np.argsort(keys, axis=1)[:, :wanted]
+        chars = np.array([ord('T')] * num_treasures + [ord('M')] * num_monsters, dtype=np.uint8)
+        
+        # Treasures first, then monsters, as far as the safe tiles go
+        valid = np.arange(picks.shape[1])[None, :] < safe.sum(axis=1)[:, None]
+        n, k = np.nonzero(valid)
+        flat[n, picks[n, k]] = chars[k]
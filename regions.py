@@ -0,0 +1,106 @@
+# Regions - connected floor areas of a level, kept up to date while carving
+
+class RegionMap:
+    """
+    Union-find over the walkable tiles of a level.
+    
+    Built with one pass over the grid. carve() turns a wall into floor
+    and merges the regions around it in near-constant time, so the
+    repair stages can ask whether two tiles are connected, or how big
+    a region is, without running another BFS. Only changes from wall
+    to non-wall are tracked: build a new map after adding walls.
+    """
+    
+    __slots__ = ('level', 'parent', 'size')
+    
+    def __init__(self, level):
+        self.level = level
+        width = level.width
+        walkable = level.walkable
+        parent = list(range(len(walkable)))
+        size = [1] * len(walkable)
+        self.parent = parent
+        self.size = size
+        
+        # Join every walkable tile with its walkable left and upper neighbours.
+        # A tile whose left, upper-left and upper neighbours are all floor
+        # is already in the upper one's region through the left one.
+        find = self.find
+        for idx in range(len(walkable)):
+            if not walkable[idx]:
+                continue
+            left = idx % width and walkable[idx - 1]
+            if left:
+                root = find(idx - 1)
+                parent[idx] = root
+                size[root] += 1
+            if idx >= width and walkable[idx - width] and not (left and walkable[idx - width - 1]):
+                self._union(idx, idx - width)
+    
+    def find(self, idx):
+        """Root of the region holding a flat index."""
+        parent = self.parent
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+    
+    def _union(self, a, b):
+        """Merge the regions of two flat indices. Returns False if they already were one."""
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return True
+    
+    def carve(self, i, j, char='.'):
+        """Set a tile, joining it to the walkable tiles around it if it was a wall."""
+        level = self.level
+        width = level.width
+        idx = i * width + j
+        was_walkable = level.walkable[idx]
+        level.set(i, j, char)
+        if was_walkable or char == '#':
+            return
+        
+        walkable = level.walkable
+        if i > 0 and walkable[idx - width]:
+            self._union(idx, idx - width)
+        if i < level.height - 1 and walkable[idx + width]:
+            self._union(idx, idx + width)
+        if j > 0 and walkable[idx - 1]:
+            self._union(idx, idx - 1)
+        if j < width - 1 and walkable[idx + 1]:
+            self._union(idx, idx + 1)
+    
+    def connected(self, a, b):
+        """Check if two (i, j) positions are in the same region."""
+        width = self.level.width
+        return self.find(a[0] * width + a[1]) == self.find(b[0] * width + b[1])
+    
+    def region_size(self, pos):
+        """Number of tiles in the region holding an (i, j) position."""
+        return self.size[self.find(pos[0] * self.level.width + pos[1])]
+    
+    def is_playable(self):
+        """Check if the player can reach the exit. Returns (playable, message) like LevelValidator."""
+        player = self.level.find('P')
+        if not player:
+            return False, "No player start"
+        exit_pos = self.level.find('E')
+        if not exit_pos:
+            return False, "No exit"
+        if self.connected(player, exit_pos):
+            return True, "Playable"
+        return False, "Exit not reachable"
+    
+    def get_connectivity(self):
+        """Fraction of walkable tiles in the player's region."""
+        player = self.level.find('P')
+        walkable = self.level.walkable_count()
+        if not player or walkable == 0:
+            return 0.0
+        return self.region_size(player) / walkable
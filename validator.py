@@ -2,27 +2,48 @@
 
 from collections import deque
 
+from level import Level
+
+# Tiles reported in LevelAnalysis.positions
+ENTITY_TILES = ('P', 'E', 'T', 'M', 'K', 'D')
+
+
+class LevelAnalysis:
+    """Everything the validator knows about a level, from one scan and one BFS."""
+    
+    __slots__ = ('playable', 'message', 'connectivity', 'reachable_count', 'walkable_count',
+                 'positions', 'reachable_mask')
+    
+    def __init__(self, playable, message, connectivity, reachable_count, walkable_count, positions, reachable_mask):
+        self.playable = playable
+        self.message = message
+        self.connectivity = connectivity
+        self.reachable_count = reachable_count
+        self.walkable_count = walkable_count
+        self.positions = positions
+        self.reachable_mask = reachable_mask
+
+
 class LevelValidator:
     """Validates that a level is playable using Breadth-First Search."""
     
     def __init__(self, level):
-        self.grid = [list(row) for row in level]
-        self.height = len(self.grid)
-        self.width = len(self.grid[0])
+        # A Level is used as-is (no copy), plain rows are converted once
+        self.level = level if isinstance(level, Level) else Level(level)
+        self.height = self.level.height
+        self.width = self.level.width
+        self._analysis = None
     
     def find_tile(self, char):
         """Find position of a tile."""
-        for i in range(self.height):
-            for j in range(self.width):
-                if self.grid[i][j] == char:
-                    return (i, j)
-        return None
+        if char == '#':
+            idx = self.level.tiles.find(b'#')
+            return divmod(idx, self.width) if idx >= 0 else None
+        return self.level.find(char)
     
     def is_walkable(self, i, j):
         """Check if position is walkable (not a wall)."""
-        if 0 <= i < self.height and 0 <= j < self.width:
-            return self.grid[i][j] != '#'
-        return False
+        return self.level.is_walkable(i, j)
     
     def bfs(self, start):
         """
@@ -32,49 +53,75 @@ class LevelValidator:
         starting from the player position. It uses a queue
         to process tiles in order of distance from start.
         """
-        visited = set()
-        queue = deque([start])
-        visited.add(start)
+        order, _ = self._flood(start)
+        return {divmod(idx, self.width) for idx in order}
+    
+    def _flood(self, start):
+        """BFS over flat indices (i * width + j). Returns (visit order, seen mask)."""
+        width = self.width
+        walkable = self.level.walkable
+        
+        start_idx = start[0] * width + start[1]
+        seen = bytearray(len(walkable))
+        seen[start_idx] = 1
+        order = [start_idx]
+        queue = deque(order)
         
         while queue:
-            i, j = queue.popleft()
+            idx = queue.popleft()
+            j = idx % width
             
             # Check 4 directions: up, down, left, right
-            for di, dj in [(-1,0), (1,0), (0,-1), (0,1)]:
-                ni, nj = i + di, j + dj
-                if (ni, nj) not in visited and self.is_walkable(ni, nj):
-                    visited.add((ni, nj))
-                    queue.append((ni, nj))
+            for n, inside in ((idx - width, idx >= width), (idx + width, idx + width < len(walkable)),
+                              (idx - 1, j > 0), (idx + 1, j < width - 1)):
+                if inside and not seen[n] and walkable[n]:
+                    seen[n] = 1
+                    order.append(n)
+                    queue.append(n)
         
-        return visited
+        return order, seen
     
-    def is_playable(self):
-        """Check if player can reach exit."""
-        player = self.find_tile('P')
-        exit_tile = self.find_tile('E')
+    def analyze(self):
+        """
+        Scan the level once and BFS once from the player.
         
-        if not player:
-            return False, "No player start"
-        if not exit_tile:
-            return False, "No exit"
+        The result is memoized, so is_playable() and get_connectivity()
+        share the same pass. Build a new validator after editing the level.
+        """
+        if self._analysis is not None:
+            return self._analysis
+        
+        positions = {char: self.level.positions(char) for char in ENTITY_TILES}
+        walkable_count = self.level.walkable_count()
+        player = positions['P'][0] if positions['P'] else None
+        exit_tile = positions['E'][0] if positions['E'] else None
         
-        reachable = self.bfs(player)
+        reachable_count = 0
+        reachable_mask = None
+        if player:
+            order, reachable_mask = self._flood(player)
+            reachable_count = len(order)
         
-        if exit_tile in reachable:
-            return True, "Playable"
+        if not player:
+            playable, message = False, "No player start"
+        elif not exit_tile:
+            playable, message = False, "No exit"
+        elif reachable_mask[exit_tile[0] * self.width + exit_tile[1]]:
+            playable, message = True, "Playable"
         else:
-            return False, "Exit not reachable"
+            playable, message = False, "Exit not reachable"
+        
+        connectivity = reachable_count / walkable_count if player and walkable_count > 0 else 0.0
+        
+        self._analysis = LevelAnalysis(playable, message, connectivity, reachable_count, walkable_count,
+                                       positions, reachable_mask)
+        return self._analysis
+    
+    def is_playable(self):
+        """Check if player can reach exit."""
+        analysis = self.analyze()
+        return analysis.playable, analysis.message
     
     def get_connectivity(self):
         """Calculate what percentage of floor tiles are reachable."""
-        player = self.find_tile('P')
-        if not player:
-            return 0.0
-        
-        reachable = self.bfs(player)
-        total_walkable = sum(1 for i in range(self.height) 
-                           for j in range(self.width) 
-                           if self.is_walkable(i, j))
-        
-        return len(reachable) / total_walkable if total_walkable > 0 else 0.0
-
+        return self.analyze().connectivity
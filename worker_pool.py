@@ -0,0 +1,212 @@
+# Worker Pool - runs the generation pipeline in several processes
+
+import os
+import queue
+import random
+import traceback
+import multiprocessing
+
+from model_registry import get_engine
+from config import MODEL_NAME, WORKER_PROCESSES, WORKER_THREADS, PIN_WORKERS, GENERATION_SEED, OUTPUT_CACHE_DIR
+
+# Message a worker gets to shut down
+STOP = None
+
+# Seeds apart between workers when generation is seeded (worker k starts at seed + k * SEED_STRIDE)
+SEED_STRIDE = 1000000
+
+# Workers started when WORKER_PROCESSES is None; each may hold its own copy of the weights
+DEFAULT_WORKERS = 4
+
+# How often a waiting completed() checks that the workers are still alive
+POLL_SECONDS = 1.0
+
+
+def _worker_main(index, cores, threads, model_name, tasks, results):
+    """Worker process: set up threads and pinning, load the model, then run generate() for each task."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+    from level_generator import LevelGenerator
+    
+    if cores:
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+    
+    # Fresh torch processes all start from the same seed, give each worker its own
+    random.seed()
+    torch.seed()
+    
+    # CachedEngine seeds every call itself, so each worker gets its own range of seeds
+    seed = None
+    if GENERATION_SEED is not None or OUTPUT_CACHE_DIR:
+        seed = (GENERATION_SEED or 0) + index * SEED_STRIDE
+    
+    engine = get_engine(model_name)
+    # LLMEngine applies INTRA_OP_THREADS while loading, the worker's share wins
+    torch.set_num_threads(threads)
+    generator = LevelGenerator(engine, seed=seed)
+    
+    while True:
+        task = tasks.get()
+        if task is STOP:
+            break
+        task_id, difficulty, num_treasures, num_monsters = task
+        # Lets the parent tell which tasks are lost if this worker dies
+        results.put((task_id, index, "started", None))
+        try:
+            level = generator.generate(difficulty, num_treasures, num_monsters)
+            results.put((task_id, index, "done", level))
+        except Exception:
+            results.put((task_id, index, "error", traceback.format_exc()))
+
+
+class WorkerPool:
+    """
+    Generates levels in several worker processes at once.
+    
+    Workers are started with spawn, not forked, so none of them
+    inherits a torch/OpenMP thread pool from a parent that already ran
+    the model (forking one deadlocks the children). Each worker loads
+    the model itself. Safetensors checkpoints are memory-mapped, so
+    the weights are shared through the page cache only while the
+    model runs in the dtype the checkpoint stores: an fp32 checkpoint
+    with CPU_PRECISION "fp32". A bf16 checkpoint (like TinyLlama's,
+    loaded as fp32), or int8/bf16 modes, give every worker a private
+    copy, which is why only a few workers start by default. The CPU
+    cores are split between the workers for torch's threads, and with
+    pin each worker is bound to its own cores. Every worker runs the
+    whole generate() pipeline, so repair and validation run in
+    parallel too, outside the parent's GIL. Finished levels are
+    streamed back in the order they complete; if a worker dies,
+    completed() raises for the tasks it was running instead of
+    waiting for them. As with any spawn pool, scripts that use it
+    need an if __name__ == "__main__" guard.
+    """
+    
+    def __init__(self, workers=WORKER_PROCESSES, threads=WORKER_THREADS, pin=PIN_WORKERS, model_name=MODEL_NAME):
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+        if workers is None:
+            workers = max(1, min(DEFAULT_WORKERS, len(cores) // (threads or 1)))
+        if threads is None:
+            threads = max(1, len(cores) // workers)
+        
+        self.workers = workers
+        self.threads = threads
+        self.model_name = model_name
+        # Contiguous blocks of cores, so a worker's cores share a socket where possible
+        self.core_sets = [cores[k * threads:(k + 1) * threads] if pin else None for k in range(workers)]
+        
+        self.context = multiprocessing.get_context("spawn")
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.processes = []
+        self.next_id = 0
+        self.pending = set()
+        self.finished = {}
+        # Worker index running each started task
+        self.assigned = {}
+    
+    def start(self):
+        """Start the workers, each loads the model on its own."""
+        if self.processes:
+            return
+        for index, cores in enumerate(self.core_sets):
+            process = self.context.Process(
+                target=_worker_main,
+                args=(index, cores, self.threads, self.model_name, self.tasks, self.results),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+    
+    def stop(self):
+        """Let the workers finish their current task and exit."""
+        for _ in self.processes:
+            self.tasks.put(STOP)
+        for process in self.processes:
+            process.join()
+        self.processes = []
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+    
+    def submit(self, difficulty="medium", num_treasures=None, num_monsters=None):
+        """Queue one level. Returns its task id."""
+        self.start()
+        task_id = self.next_id
+        self.next_id += 1
+        self.pending.add(task_id)
+        self.tasks.put((task_id, difficulty, num_treasures, num_monsters))
+        return task_id
+    
+    def completed(self, task_ids=None):
+        """
+        Yield (task id, level) as workers finish, for the given tasks or all pending ones.
+        
+        Levels finished for other tasks meanwhile are kept for a later call.
+        """
+        wanted = set(self.pending) | set(self.finished) if task_ids is None else set(task_ids)
+        for task_id in list(wanted):
+            if task_id in self.finished:
+                wanted.discard(task_id)
+                yield task_id, self.finished.pop(task_id)
+        
+        while wanted:
+            try:
+                task_id, index, kind, level = self.results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if kind == "started":
+                self.assigned[task_id] = index
+                continue
+            
+            self.assigned.pop(task_id, None)
+            self.pending.discard(task_id)
+            if kind == "error":
+                wanted.discard(task_id)
+                raise RuntimeError(f"Worker failed on task {task_id}:\n{level}")
+            if task_id in wanted:
+                wanted.discard(task_id)
+                yield task_id, level
+            else:
+                self.finished[task_id] = level
+    
+    def _check_workers(self):
+        """Raise for pending tasks that can't finish because their worker, or every worker, died."""
+        dead = {k: p.exitcode for k, p in enumerate(self.processes) if not p.is_alive()}
+        if not dead:
+            return
+        if len(dead) == len(self.processes):
+            lost = set(self.pending)
+        else:
+            lost = {t for t, k in self.assigned.items() if k in dead and t in self.pending}
+        if not lost:
+            return
+        
+        self.pending -= lost
+        for task_id in lost:
+            self.assigned.pop(task_id, None)
+        codes = ", ".join(f"{k} (exit code {code})" for k, code in sorted(dead.items()))
+        raise RuntimeError(f"Worker(s) {codes} died, tasks {sorted(lost)} will not finish")
+    
+    def generate_many(self, difficulties, count=1):
+        """
+        Generate count levels per difficulty across the workers.
+        
+        Yields (difficulty, level) pairs as soon as each level is done,
+        not in request order.
+        """
+        if isinstance(difficulties, str):
+            difficulties = [difficulties]
+        requested = {}
+        for diff in difficulties:
+            for _ in range(count):
+                requested[self.submit(diff)] = diff
+        for task_id, level in self.completed(requested):
+            yield requested[task_id], level